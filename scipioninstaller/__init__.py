@@ -1,2 +1,6 @@
 INSTALL_ENTRY = 'installscipion'
-__version__ = '1.0.16'
+__version__ = '1.0.17'
+
+
+class InstallationError(Exception):
+    pass
@@ -0,0 +1,412 @@
+# -*- coding: utf-8 -*-
+"""
+Installation benchmark: runs the installer (conda and virtualenv, devel and
+pip mode, with and without Xmipp) against local stand-ins, without network:
+
+ - bare git repositories served from disk (SCIPION_GIT_SERVER)
+ - a file:// package index with dummy scipion wheels
+ - fake conda, xmipp and scipion programs with configurable delays
+
+and reports the time of each installation step, taken from the installation
+trace. Usage: python -m scipioninstaller.benchmark [-h]
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from scipioninstaller import __version__
+from scipioninstaller.installer import TRACE_NAME, SCIPION_GIT_SERVER
+
+PACKAGE_VERSION = "3.99.0"
+BRANCH = "devel"
+GIT_CONFIG = ["-c", "user.name=benchmark", "-c", "user.email=benchmark@localhost"]
+
+# In-tree PEP 517/660 build backend of the dummy repositories. Needs nothing
+# but the standard library, so pip builds them without any index.
+BACKEND_CODE = '''
+import base64
+import hashlib
+import json
+import os
+import zipfile
+
+
+def writeWheel(wheelDir, name, version, files, requires=()):
+    """ Write a pure python wheel with files {archive path: content} """
+    distName = name.replace("-", "_")
+    distInfo = "%s-%s.dist-info" % (distName, version)
+    files = dict(files)
+    files[distInfo + "/METADATA"] = "".join(
+        ["Metadata-Version: 2.1\\nName: %s\\nVersion: %s\\n" % (name, version)] +
+        ["Requires-Dist: %s\\n" % req for req in requires])
+    files[distInfo + "/WHEEL"] = ("Wheel-Version: 1.0\\nGenerator: benchmark\\n"
+                                  "Root-Is-Purelib: true\\nTag: py3-none-any\\n")
+    record = []
+    for path in sorted(files):
+        data = files[path].encode("utf-8")
+        digest = base64.urlsafe_b64encode(hashlib.sha256(data).digest()).rstrip(b"=")
+        record.append("%s,sha256=%s,%s" % (path, digest.decode(), len(data)))
+    record.append(distInfo + "/RECORD,,")
+    files[distInfo + "/RECORD"] = "\\n".join(record) + "\\n"
+
+    wheelName = "%s-%s-py3-none-any.whl" % (distName, version)
+    with zipfile.ZipFile(os.path.join(wheelDir, wheelName), "w") as wheel:
+        for path in sorted(files):
+            wheel.writestr(path, files[path])
+    return wheelName
+
+
+def _package():
+    with open("benchmark_package.json") as fh:
+        return json.load(fh)
+
+
+def _sources(package):
+    files = {}
+    for module in package["modules"]:
+        for root, dirs, names in os.walk(module):
+            for fileName in names:
+                if fileName.endswith(".py"):
+                    path = os.path.join(root, fileName)
+                    with open(path) as fh:
+                        files[path.replace(os.sep, "/")] = fh.read()
+    return files
+
+
+def build_wheel(wheel_directory, config_settings=None, metadata_directory=None):
+    package = _package()
+    return writeWheel(wheel_directory, package["name"], package["version"],
+                      _sources(package), package["requires"])
+
+
+def build_editable(wheel_directory, config_settings=None, metadata_directory=None):
+    package = _package()
+    pth = {package["name"].replace("-", "_") + ".pth": os.path.abspath(".") + "\\n"}
+    return writeWheel(wheel_directory, package["name"], package["version"],
+                      pth, package["requires"])
+'''
+
+# Dummy packages: name -> (modules {module: {file: content}}, requirements)
+SCIPION_MAIN = '''import os
+import sys
+import time
+
+# Fake scipion: installb and installp "build" binaries
+if len(sys.argv) > 1 and sys.argv[1] in ["installb", "installp"]:
+    time.sleep(%(buildDelay)s)
+    plugin = sys.argv[sys.argv.index("-p") + 1] if "-p" in sys.argv else "xmipp"
+    target = os.path.join(os.environ["SCIPION_HOME"], "software", "em",
+                          "xmipp" if plugin == "scipion-em-xmipp" else plugin)
+    if not os.path.exists(target):
+        os.makedirs(target)
+    with open(os.path.join(target, "built"), "w") as fh:
+        fh.write(" ".join(sys.argv[1:]))
+'''
+
+PACKAGES = {
+    "scipion-pyworkflow": ({"pyworkflow": {"__init__.py": "__version__ = '%(version)s'\n"}}, []),
+    "scipion-em": ({"pwem": {"__init__.py": "__version__ = '%(version)s'\n"}}, []),
+    "scipion-app": ({"scipion": {"__init__.py": "__version__ = '%(version)s'\n",
+                                 "__main__.py": SCIPION_MAIN}},
+                    ["scipion-pyworkflow", "scipion-em"]),
+    "scipion-em-xmipp": ({"xmipp3": {"__init__.py": "__version__ = '%(version)s'\n"}},
+                         ["scipion-em"]),
+}
+# Plugins for -plugins, e.g.: -- -plugins scipion-em-dummy1 -plugins scipion-em-dummy2
+for index in range(1, 4):
+    PACKAGES["scipion-em-dummy%s" % index] = (
+        {"dummy%s" % index: {"__init__.py": "__version__ = '%(version)s'\n"}}, ["scipion-em"])
+
+# Repositories in the git server: organization/name
+REPOS = ["scipion-em/scipion-pyworkflow", "scipion-em/scipion-em",
+         "scipion-em/scipion-app", "i2pc/scipion-em-xmipp", "i2pc/xmipp"]
+
+XMIPP_SCRIPT = '''#!/usr/bin/env python3
+# Fake xmipp script
+import os
+import subprocess
+import sys
+import time
+
+here = os.path.dirname(os.path.abspath(__file__))
+time.sleep(%(xmippDelay)s)
+if sys.argv[1] == "get_devel_sources":
+    branch = sys.argv[2] if len(sys.argv) > 2 else "devel"
+    dest = os.path.join(here, "src", "scipion-em-xmipp")
+    if not os.path.exists(dest):
+        url = os.environ["%(serverVar)s"] + "/i2pc/scipion-em-xmipp.git"
+        sys.exit(subprocess.call(["git", "clone", "--quiet", "--branch", branch, url, dest]))
+    sys.exit(subprocess.call(["git", "pull", "--quiet"], cwd=dest))
+elif sys.argv[1] == "config":
+    with open(os.path.join(here, "xmipp.conf"), "w") as fh:
+        fh.write("CXX=g++\\n")
+'''
+
+CONDA_SCRIPT = '''#!%(python)s
+# Fake conda: environments are python venvs under %(root)s/envs
+import os
+import subprocess
+import sys
+import time
+
+root = %(root)r
+args = sys.argv[1:]
+if args[:1] == ["shell.bash"] or args[:2] == ["shell", "hook"] or (args and args[0].startswith("shell.")):
+    print(\'\'\'conda() {
+  if [ "$1" = "activate" ]; then
+    case "$2" in
+      /*) export CONDA_PREFIX="$2" ;;
+      *) export CONDA_PREFIX="%%s/envs/$2" ;;
+    esac
+    export CONDA_DEFAULT_ENV="$2"
+    export PATH="$CONDA_PREFIX/bin:$PATH"
+  else
+    "%%s" "$@"
+  fi
+}\'\'\' %% (root, os.path.abspath(__file__)))
+elif args[:1] == ["create"]:
+    time.sleep(%(condaDelay)s)
+    name = args[args.index("-n") + 1]
+    sys.exit(subprocess.call([sys.executable, "-m", "venv",
+                              os.path.join(root, "envs", name)]))
+'''
+
+# Used when virtualenv is not installed: python -m virtualenv -> venv
+VIRTUALENV_STUB = '''import subprocess
+import sys
+
+args = [arg for arg in sys.argv[1:] if not arg.startswith("--python")]
+sys.exit(subprocess.call([sys.executable, "-m", "venv"] + args))
+'''
+
+SCENARIOS = [(env, dev, xmipp) for env in ["conda", "venv"]
+             for dev in [False, True] for xmipp in [False, True]]
+
+
+def loadBackend():
+    namespace = {}
+    exec(BACKEND_CODE, namespace)
+    return namespace
+
+
+def writeText(path, content, executable=False):
+    folder = os.path.dirname(path)
+    if not os.path.exists(folder):
+        os.makedirs(folder)
+    with open(path, "w") as fh:
+        fh.write(content)
+    if executable:
+        os.chmod(path, 0o755)
+
+
+def getPackageFiles(name, options):
+    modules, requires = PACKAGES[name]
+    files = {}
+    for module, contents in modules.items():
+        for fileName, content in contents.items():
+            files["%s/%s" % (module, fileName)] = content % options
+    return files, requires
+
+
+def createIndex(workDir, options):
+    """ PEP 503 simple index, as a folder, with the dummy wheels """
+    backend = loadBackend()
+    wheels = os.path.join(workDir, "wheels")
+    os.makedirs(wheels)
+    simple = os.path.join(workDir, "index", "simple")
+    for name in sorted(PACKAGES):
+        files, requires = getPackageFiles(name, options)
+        wheelName = backend["writeWheel"](wheels, name, PACKAGE_VERSION, files, requires)
+        projectDir = os.path.join(simple, name)
+        os.makedirs(projectDir)
+        shutil.copy(os.path.join(wheels, wheelName), projectDir)
+        writeText(os.path.join(projectDir, "index.html"),
+                  '<html><body><a href="%s">%s</a></body></html>\n' % (wheelName, wheelName))
+    writeText(os.path.join(simple, "index.html"),
+              "<html><body>%s</body></html>\n" % "".join(
+                  '<a href="%s/">%s</a>' % (name, name) for name in sorted(PACKAGES)))
+    return "file://" + simple
+
+
+def git(args, cwd):
+    subprocess.check_call(["git"] + GIT_CONFIG + args, cwd=cwd,
+                          stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+
+
+def createGitServer(workDir, options):
+    """ Bare repositories server/<organization>/<name>.git with a devel branch """
+    server = os.path.join(workDir, "git")
+    for repo in REPOS:
+        organization, name = repo.split("/")
+        source = os.path.join(workDir, "sources", name)
+        if name == "xmipp":
+            writeText(os.path.join(source, "xmipp"), XMIPP_SCRIPT % options, executable=True)
+            writeText(os.path.join(source, ".gitignore"), "src/\nxmipp.conf\nbuild/\n")
+        else:
+            files, requires = getPackageFiles(name, options)
+            for path, content in files.items():
+                writeText(os.path.join(source, path), content)
+            writeText(os.path.join(source, "benchmark_package.json"), json.dumps(
+                {"name": name, "version": PACKAGE_VERSION, "requires": requires,
+                 "modules": sorted(set(path.split("/")[0] for path in files))}))
+            writeText(os.path.join(source, "benchmark_backend.py"), BACKEND_CODE)
+            writeText(os.path.join(source, "pyproject.toml"),
+                      '[build-system]\nrequires = []\nbuild-backend = "benchmark_backend"\n'
+                      'backend-path = ["."]\n')
+        bare = os.path.join(server, organization, name + ".git")
+        os.makedirs(bare)
+        git(["init", "--quiet", "--bare"], bare)
+        git(["init", "--quiet"], source)
+        git(["checkout", "--quiet", "-b", BRANCH], source)
+        git(["add", "."], source)
+        git(["commit", "--quiet", "-m", "benchmark"], source)
+        git(["push", "--quiet", bare, BRANCH], source)
+    return "file://" + server
+
+
+def isModuleAvailable(name):
+    """ True if module name can be imported, without importing it """
+    try:
+        from importlib.util import find_spec
+    except ImportError:  # python 2
+        import imp
+        try:
+            imp.find_module(name)
+            return True
+        except ImportError:
+            return False
+    return find_spec(name) is not None
+
+
+def createFakePrograms(workDir, options):
+    binDir = os.path.join(workDir, "bin")
+    writeText(os.path.join(binDir, "conda"),
+              CONDA_SCRIPT % dict(options, python=sys.executable,
+                                  root=os.path.join(workDir, "conda")),
+              executable=True)
+    stubs = None
+    if not isModuleAvailable("virtualenv"):
+        stubs = os.path.join(workDir, "stubs")
+        writeText(os.path.join(stubs, "virtualenv", "__init__.py"), "")
+        writeText(os.path.join(stubs, "virtualenv", "__main__.py"), VIRTUALENV_STUB)
+    return binDir, stubs
+
+
+def getScenarioName(env, dev, xmipp):
+    return "%s-%s-%s" % (env, "dev" if dev else "pip", "xmipp" if xmipp else "noXmipp")
+
+
+def runScenario(workDir, environ, env, dev, xmipp, installerArgs):
+    name = getScenarioName(env, dev, xmipp)
+    scipionHome = os.path.join(workDir, "installs", name)
+    cmd = [sys.executable, "-m", "scipioninstaller", scipionHome, "-noAsk",
+           "-n", "scipion3-" + name]
+    cmd += ["-conda", "-solver", "conda"] if env == "conda" else ["-venv", "-venvTool", "virtualenv"]
+    if dev:
+        cmd += ["-dev", "-httpsClone"]
+    if not xmipp:
+        cmd.append("-noXmipp")
+    cmd += installerArgs
+
+    logFn = os.path.join(workDir, "logs", name + ".log")
+    if not os.path.exists(os.path.dirname(logFn)):
+        os.makedirs(os.path.dirname(logFn))
+    start = time.time()
+    with open(logFn, "w") as log:
+        returnCode = subprocess.call(cmd, env=environ, stdout=log, stderr=subprocess.STDOUT)
+    total = time.time() - start
+
+    steps = {}
+    traceFn = os.path.join(scipionHome, TRACE_NAME)
+    if os.path.exists(traceFn):
+        with open(traceFn) as fh:
+            steps = dict((step["name"], step["wall"])
+                         for step in json.load(fh)["otherData"]["steps"])
+    return {"scenario": name, "returncode": returnCode, "total": total,
+            "steps": steps, "log": logFn}
+
+
+def printResults(results):
+    for result in results:
+        status = "ok" if result["returncode"] == 0 else "FAILED (see %s)" % result["log"]
+        print("%-26s %8.2fs  %s" % (result["scenario"], result["total"], status))
+        for step, elapsed in sorted(result["steps"].items(), key=lambda item: -item[1]):
+            print("    %-30s %8.2fs" % (step, elapsed))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m scipioninstaller.benchmark",
+                                     description="Benchmarks the installer against "
+                                                 "local git repositories, package index "
+                                                 "and fake conda/xmipp/scipion programs.")
+    parser.add_argument("-workDir", help="Folder for the stand-ins and installations. "
+                                         "A temporary one, removed at the end, by default.",
+                        default=None)
+    parser.add_argument("-scenarios", help="Only run scenarios whose name contains any "
+                                           "of these (e.g. conda-dev venv-pip-noXmipp).",
+                        nargs="*", default=None)
+    parser.add_argument("-condaDelay", help="Seconds taken by conda create.",
+                        type=float, default=1.0)
+    parser.add_argument("-xmippDelay", help="Seconds taken by each xmipp script command.",
+                        type=float, default=0.5)
+    parser.add_argument("-buildDelay", help="Seconds taken by scipion installb/installp.",
+                        type=float, default=2.0)
+    parser.add_argument("-output", help="Json file to write the results into.",
+                        default=None)
+    parser.add_argument("installerArgs", nargs=argparse.REMAINDER,
+                        help="Extra installer arguments, after --.")
+    args = parser.parse_args(argv)
+    installerArgs = [arg for arg in args.installerArgs if arg != "--"]
+
+    workDir = os.path.abspath(args.workDir) if args.workDir else tempfile.mkdtemp(prefix="scipion-bench-")
+    if not os.path.exists(workDir):
+        os.makedirs(workDir)
+    options = {"version": PACKAGE_VERSION, "condaDelay": args.condaDelay,
+               "xmippDelay": args.xmippDelay, "buildDelay": args.buildDelay,
+               "serverVar": SCIPION_GIT_SERVER}
+
+    try:
+        indexUrl = createIndex(workDir, options)
+        serverUrl = createGitServer(workDir, options)
+        binDir, stubs = createFakePrograms(workDir, options)
+
+        environ = dict(os.environ)
+        environ.pop("CONDA_ACTIVATION_CMD", None)
+        environ.update({"PATH": binDir + os.pathsep + environ.get("PATH", ""),
+                        "SHELL": "/bin/bash",
+                        SCIPION_GIT_SERVER: serverUrl,
+                        "PIP_INDEX_URL": indexUrl,
+                        "PIP_DISABLE_PIP_VERSION_CHECK": "1",
+                        "PIP_NO_CACHE_DIR": "1"})
+        if stubs:
+            environ["PYTHONPATH"] = stubs + os.pathsep + environ.get("PYTHONPATH", "")
+
+        results = []
+        for env, dev, xmipp in SCENARIOS:
+            name = getScenarioName(env, dev, xmipp)
+            if args.scenarios and not any(s in name for s in args.scenarios):
+                continue
+            print("Running %s ..." % name)
+            sys.stdout.flush()
+            results.append(runScenario(workDir, environ, env, dev, xmipp, installerArgs))
+
+        printResults(results)
+        if args.output:
+            with open(args.output, "w") as fh:
+                json.dump({"version": __version__, "installerArgs": installerArgs,
+                           "options": options, "results": results},
+                          fh, indent=2, sort_keys=True)
+    finally:
+        if not args.workDir:
+            shutil.rmtree(workDir, ignore_errors=True)
+
+    return 0 if all(result["returncode"] == 0 for result in results) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+"""
+Caches for the Xmipp build: a compiler cache (ccache) shared by all the
+installations and an archive of the built outputs keyed by the Xmipp
+commits, the compiler and the Xmipp configuration.
+"""
+import hashlib
+import os
+import platform
+import subprocess
+import tarfile
+import threading
+
+from scipioninstaller.bundle import getMemberFilter
+
+# Compilers wrapped by ccache through symlinks named like them
+CCACHE_COMPILERS = ["gcc", "g++", "cc", "c++", "clang", "clang++"]
+XMIPP_BUNDLE = "xmipp-bundle"
+XMIPP_BUILD = os.path.join(XMIPP_BUNDLE, "build")
+# Folders filled by the Xmipp build and by the plugin builds, that may run
+# at the same time: only the Xmipp entries of them are cached
+SOFTWARE_FOLDERS = [os.path.join("software", "em"),
+                    os.path.join("software", "lib"),
+                    os.path.join("software", "bindings")]
+XMIPP_PREFIXES = ("xmipp", "libxmipp")
+XMIPP_CONF = os.path.join(XMIPP_BUNDLE, "xmipp.conf")
+
+
+def setupCcache(ccacheDir, ccachePath):
+    """ Create in ccacheDir/bin symlinks to ccache named like the compilers
+    and return the folder to put first in the PATH """
+    binDir = os.path.join(ccacheDir, "bin")
+    if not os.path.exists(binDir):
+        os.makedirs(binDir)
+    for compiler in CCACHE_COMPILERS:
+        link = os.path.join(binDir, compiler)
+        if not os.path.lexists(link):
+            os.symlink(ccachePath, link)
+    return binDir
+
+
+def getCcacheVars(ccacheDir):
+    return [("CCACHE_DIR", ccacheDir),
+            ("PATH", "%s:$PATH" % os.path.join(ccacheDir, "bin"))]
+
+
+def runOutput(cmd, cwd=None):
+    output = subprocess.check_output(cmd, cwd=cwd, stderr=subprocess.STDOUT)
+    if not isinstance(output, str):
+        output = output.decode("utf-8", "replace")
+    return output.strip()
+
+
+def getXmippRepos(scipionHome):
+    bundle = os.path.join(scipionHome, XMIPP_BUNDLE)
+    repos = [bundle]
+    src = os.path.join(bundle, "src")
+    if os.path.isdir(src):
+        repos += [os.path.join(src, name) for name in sorted(os.listdir(src))
+                  if os.path.exists(os.path.join(src, name, ".git"))]
+    return repos
+
+
+def readXmippConf(scipionHome):
+    confFn = os.path.join(scipionHome, XMIPP_CONF)
+    if not os.path.exists(confFn):
+        return ""
+    with open(confFn) as fh:
+        return fh.read()
+
+
+def getXmippCacheKey(scipionHome):
+    """ Key of the Xmipp build: commits of the Xmipp repositories, compiler
+    version, xmipp.conf and platform. None when it can not be cached,
+    e.g. when there are local changes. """
+
+    sha = hashlib.sha256()
+    try:
+        for repo in getXmippRepos(scipionHome):
+            if runOutput(["git", "status", "--porcelain", "--untracked-files=no"], repo):
+                print("%s has local changes, its build will not be cached." % repo)
+                return None
+            sha.update(("%s %s\n" % (os.path.basename(repo),
+                                     runOutput(["git", "rev-parse", "HEAD"], repo))).encode())
+
+        conf = readXmippConf(scipionHome)
+        compiler = "g++"
+        for line in conf.splitlines():
+            if line.startswith("CXX="):
+                compiler = line.split("=", 1)[1].strip() or compiler
+        sha.update(runOutput([compiler, "--version"]).splitlines()[0].encode())
+    except (subprocess.CalledProcessError, OSError, IndexError) as e:
+        print("Xmipp build key could not be computed (%s), it will not be cached." % e)
+        return None
+
+    sha.update(conf.encode())
+    sha.update(platform.machine().encode())
+    return sha.hexdigest()
+
+
+def getXmippOutputs(scipionHome):
+    """ Xmipp build outputs, relative to scipionHome: its build folder and,
+    in the software folders, the entries named after Xmipp or linking into
+    its folders. Other plugins' binaries are left out. """
+    home = os.path.abspath(scipionHome)
+    xmippDirs = [os.path.realpath(os.path.join(home, XMIPP_BUNDLE))]
+    outputs = [XMIPP_BUILD] if os.path.isdir(os.path.join(home, XMIPP_BUILD)) else []
+    for folder in SOFTWARE_FOLDERS:
+        if not os.path.isdir(os.path.join(home, folder)):
+            continue
+        for name in sorted(os.listdir(os.path.join(home, folder))):
+            path = os.path.join(home, folder, name)
+            target = os.path.realpath(path)
+            if name.lower().startswith(XMIPP_PREFIXES) or any(
+                    target.startswith(xmippDir + os.sep) for xmippDir in xmippDirs):
+                outputs.append(os.path.join(folder, name))
+                # software/em/xmipp, where the lib and bindings links go
+                xmippDirs.append(target)
+    return outputs
+
+
+def getArchivePath(cacheDir, key):
+    return os.path.join(cacheDir, "xmipp-%s.tar.gz" % key)
+
+
+def restoreXmippBuild(scipionHome, cacheDir, key):
+    """ Extract the cached build for key into scipionHome. True if found. """
+    archive = getArchivePath(cacheDir, key)
+    if key is None or not os.path.exists(archive):
+        return False
+    print("Restoring Xmipp build from %s" % archive)
+    tar = tarfile.open(archive, "r:gz")
+    # The cache folder is shared: check the members as bundles do
+    if hasattr(tarfile, "fully_trusted_filter"):
+        tar.extraction_filter = tarfile.fully_trusted_filter
+    memberFilter = getMemberFilter(archive)
+    try:
+        for info in tar:
+            tar.extract(memberFilter(info, scipionHome), scipionHome)
+    finally:
+        tar.close()
+    return True
+
+
+def saveXmippBuild(scipionHome, cacheDir, key):
+    """ Archive the Xmipp build outputs into the cache under key """
+    if key is None:
+        return
+    archive = getArchivePath(cacheDir, key)
+    # Several installations of a process (see fleet) may save it at once
+    tmpArchive = "%s.%s-%s.tmp" % (archive, os.getpid(), threading.current_thread().ident)
+    home = os.path.abspath(scipionHome)
+
+    def relativeLinks(info):
+        # Links into this installation (e.g. software/em/xmipp) have to work
+        # when restored in another SCIPION_HOME
+        if info.issym() and os.path.isabs(info.linkname) and \
+                info.linkname.startswith(home + os.sep):
+            source = os.path.join(home, os.path.dirname(info.name))
+            info.linkname = os.path.relpath(info.linkname, source)
+        return info
+
+    tar = tarfile.open(tmpArchive, "w:gz")
+    try:
+        for output in getXmippOutputs(scipionHome):
+            tar.add(os.path.join(scipionHome, output), arcname=output,
+                    filter=relativeLinks)
+    finally:
+        tar.close()
+    os.rename(tmpArchive, archive)
+    print("Xmipp build saved in %s" % archive)
@@ -0,0 +1,290 @@
+# -*- coding: utf-8 -*-
+"""
+Relocatable bundles: a finished installation (SCIPION_HOME and, for conda,
+its environment) packed in a single archive with the files where the
+original paths appear, so it can be unpacked in another path (or node) and
+fixed instead of installed again.
+"""
+import json
+import os
+import platform
+import re
+import tarfile
+import time
+
+from scipioninstaller import InstallationError, __version__
+
+BUNDLE_VERSION = 1
+METADATA_NAME = "bundle.json"
+# Archive folders of SCIPION_HOME and of an environment outside it
+HOME_FOLDER = "home"
+ENV_FOLDER = "env"
+# Only tracebacks would show the old path and their format can not be edited
+NOT_RELOCATED = (".pyc", ".pyo")
+# Speed over size: packing and unpacking should be bound by the disk
+COMPRESS_LEVEL = 1
+CHUNK = 1024 * 1024
+TEXT = "text"
+BINARY = "binary"
+
+
+def findPrefixes(path, prefixes):
+    """ Keys of the prefixes (key -> bytes) found in path and whether it
+    is a binary file. Read by chunks: libraries may be big. """
+    found = set()
+    binary = False
+    overlap = max(len(prefix) for prefix in prefixes.values()) - 1
+    previous = b""
+    with open(path, "rb") as fh:
+        while True:
+            chunk = fh.read(CHUNK)
+            if not chunk:
+                break
+            binary = binary or b"\0" in chunk
+            data = previous + chunk
+            for key, prefix in prefixes.items():
+                if prefix in data:
+                    found.add(key)
+            previous = data[-overlap:] if overlap else b""
+    return found, binary
+
+
+def scanFolder(folder, folderName, prefixes, exclude):
+    """ Files under folder (as archive names under folderName) with any of
+    the prefixes: [name, text or binary, prefix keys] """
+    files = []
+    for root, dirs, fileNames in os.walk(folder):
+        dirs[:] = [name for name in dirs
+                   if os.path.join(root, name) not in exclude]
+        for fileName in fileNames:
+            path = os.path.join(root, fileName)
+            if (path in exclude or fileName.endswith(NOT_RELOCATED)
+                    or os.path.islink(path) or not os.path.isfile(path)):
+                continue
+            try:
+                found, binary = findPrefixes(path, prefixes)
+            except (IOError, OSError):
+                continue  # Not readable, it is packed as it is
+            if found:
+                name = os.path.join(folderName, os.path.relpath(path, folder))
+                files.append([name, BINARY if binary else TEXT, sorted(found)])
+    return files
+
+
+def getLinkFilter(roots):
+    """ Tar filter making relative the absolute links of each root (folder,
+    archive folder) into itself, so they work wherever it is unpacked """
+    def relativeLinks(info):
+        if info.issym() and os.path.isabs(info.linkname):
+            for folder, folderName in roots:
+                if (info.name.startswith(folderName + "/")
+                        and info.linkname.startswith(folder + os.sep)):
+                    target = os.path.join(folderName,
+                                          os.path.relpath(info.linkname, folder))
+                    info.linkname = os.path.relpath(target, os.path.dirname(info.name))
+                    break
+        return info
+    return relativeLinks
+
+
+def exportBundle(scipionHome, bundleFn, metadata, envPrefix=None, exclude=()):
+    """ Pack scipionHome and the environment at envPrefix (when it is not
+    inside scipionHome) into bundleFn. metadata (environment manager,
+    environment name, devel...) is saved with the paths to rewrite. """
+    scipionHome = os.path.abspath(scipionHome)
+    bundleFn = os.path.abspath(bundleFn)
+    exclude = set(os.path.join(scipionHome, name) for name in exclude)
+    exclude.add(bundleFn)
+
+    roots = [(scipionHome, HOME_FOLDER)]
+    prefixes = {HOME_FOLDER: scipionHome.encode("utf-8")}
+    if envPrefix is not None and not envPrefix.startswith(scipionHome + os.sep):
+        roots.insert(0, (envPrefix, ENV_FOLDER))
+        prefixes[ENV_FOLDER] = envPrefix.encode("utf-8")
+
+    print("Looking for %s in the files to relocate..." % " and ".join(
+        folder for folder, _ in roots))
+    files = []
+    for folder, folderName in roots:
+        files += scanFolder(folder, folderName, prefixes, exclude)
+
+    metadata = dict(metadata, bundleVersion=BUNDLE_VERSION,
+                    installerVersion=__version__, created=time.time(),
+                    machine=platform.machine(),
+                    prefixes=dict((key, prefix.decode("utf-8"))
+                                  for key, prefix in prefixes.items()),
+                    files=files)
+    metadataFn = "%s.%s.json" % (bundleFn, os.getpid())
+    with open(metadataFn, "w") as fh:
+        json.dump(metadata, fh, indent=1)
+
+    print("Packing %s files into %s..." % (" and ".join(
+        folder for folder, _ in roots), bundleFn))
+    tmpBundle = "%s.%s.tmp" % (bundleFn, os.getpid())
+    linkFilter = getLinkFilter(roots)
+
+    def bundleFilter(info):
+        # tar.add recursion passes through here: skip excluded paths
+        for folder, folderName in roots:
+            if info.name == folderName or info.name.startswith(folderName + "/"):
+                path = os.path.join(folder, os.path.relpath(info.name, folderName))
+                if path in exclude:
+                    return None
+        return linkFilter(info)
+
+    tar = tarfile.open(tmpBundle, "w:gz", compresslevel=COMPRESS_LEVEL)
+    try:
+        # First, so importing can read it before unpacking anything
+        tar.add(metadataFn, arcname=METADATA_NAME)
+        for folder, folderName in roots:
+            tar.add(folder, arcname=folderName, filter=bundleFilter)
+    finally:
+        tar.close()
+        os.remove(metadataFn)
+    os.rename(tmpBundle, bundleFn)
+    return metadata
+
+
+def readMetadata(bundleFn):
+    """ Metadata of the bundle, without reading the rest of it """
+    try:
+        tar = tarfile.open(bundleFn, "r|gz")
+        try:
+            info = tar.next()
+            if info is None or info.name != METADATA_NAME:
+                raise InstallationError("%s is not a Scipion bundle: %s not found."
+                                        % (bundleFn, METADATA_NAME))
+            metadata = json.loads(tar.extractfile(info).read().decode("utf-8"))
+        finally:
+            tar.close()
+    except (IOError, OSError, tarfile.TarError) as e:
+        raise InstallationError("Bundle %s could not be read: %s" % (bundleFn, e))
+
+    if metadata.get("bundleVersion") != BUNDLE_VERSION:
+        raise InstallationError("Bundle %s was made by an incompatible installer "
+                                "(%s)." % (bundleFn, metadata.get("installerVersion")))
+    if metadata["machine"] != platform.machine():
+        raise InstallationError("Bundle %s was made for %s machines, this is %s."
+                                % (bundleFn, metadata["machine"], platform.machine()))
+    return metadata
+
+
+def replaceBinary(data, old, new):
+    """ Replace old by new in the null terminated strings of data, padding
+    with nulls to keep the size. new can not be longer than old. """
+    pattern = re.compile(re.escape(old) + b"([^\0]*)\0")
+
+    def pad(match):
+        value = new + match.group(1)
+        return value + b"\0" * (len(match.group(0)) - len(value))
+    return pattern.sub(pad, data)
+
+
+def relocateFile(path, kind, replacements):
+    """ Rewrite the prefixes of path. False if it could not be done. """
+    with open(path, "rb") as fh:
+        data = fh.read()
+    for old, new in replacements:
+        if kind == TEXT:
+            data = data.replace(old, new)
+        elif len(new) <= len(old):
+            data = replaceBinary(data, old, new)
+        else:
+            return False
+    mode = os.stat(path).st_mode
+    os.chmod(path, mode | 0o200)  # Read only files, e.g. in conda packages
+    with open(path, "wb") as fh:
+        fh.write(data)
+    os.chmod(path, mode)
+    return True
+
+
+def isOutside(name):
+    """ True if the normalized relative path name leaves its folder """
+    return os.path.isabs(name) or name == os.pardir or name.startswith(os.pardir + os.sep)
+
+
+def getMemberFilter(archiveFn):
+    """ Function checking each member of archiveFn, in order, before it is
+    extracted into a folder (path). Members that would be written out of it
+    are refused: absolute or .. names and hard link targets, and paths
+    through a symbolic link of the archive. Return the member as filtered
+    by tarfile.data_filter, but links: symbolic ones may point anywhere,
+    e.g. to the system python of a virtualenv, they are not followed. """
+    links = set()
+
+    def memberFilter(info, path):
+        # The target of a hard link may be a symbolic link, not go through one
+        names = [(info.name, True)]
+        if info.islnk():
+            names.append((info.linkname, False))
+        for name, itself in names:
+            name = os.path.normpath(name)
+            parts = name.split(os.sep)
+            prefixes = [os.sep.join(parts[:i])
+                        for i in range(1, len(parts) + (1 if itself else 0))]
+            if isOutside(name) or any(prefix in links for prefix in prefixes):
+                raise InstallationError("%s can not be extracted, %s would be written "
+                                        "out of %s." % (archiveFn, info.name, path))
+        if info.issym():
+            links.add(os.path.normpath(info.name))
+        if info.issym() or info.islnk() or not hasattr(tarfile, "data_filter"):
+            return info
+        try:
+            return tarfile.data_filter(info, path)
+        except tarfile.FilterError as e:
+            raise InstallationError("%s can not be extracted: %s" % (archiveFn, e))
+    return memberFilter
+
+
+def importBundle(bundleFn, scipionHome, envPrefix=None):
+    """ Unpack bundleFn into scipionHome, and its environment, if any, into
+    envPrefix, rewriting the original paths. Return the metadata. """
+    metadata = readMetadata(bundleFn)
+    scipionHome = os.path.abspath(scipionHome)
+    targets = {HOME_FOLDER: scipionHome}
+    if ENV_FOLDER in metadata["prefixes"]:
+        if envPrefix is None:
+            raise InstallationError("Bundle %s has an environment outside "
+                                    "SCIPION_HOME, its location is needed." % bundleFn)
+        targets[ENV_FOLDER] = os.path.abspath(envPrefix)
+    for target in targets.values():
+        if os.path.exists(target) and os.listdir(target):
+            raise InstallationError("%s is not empty, bundles are unpacked "
+                                    "in new folders." % target)
+
+    print("Unpacking %s into %s..." % (bundleFn, " and ".join(targets.values())))
+    tar = tarfile.open(bundleFn, "r|gz")
+    # Members are filtered by memberFilter, once their names are relative
+    if hasattr(tarfile, "fully_trusted_filter"):
+        tar.extraction_filter = tarfile.fully_trusted_filter
+    memberFilter = getMemberFilter(bundleFn)
+    try:
+        for info in tar:
+            folderName = info.name.split("/", 1)[0]
+            if folderName not in targets:
+                continue
+            # Extract it relative to its target folder
+            info.name = os.path.relpath(info.name, folderName)
+            if info.islnk():
+                info.linkname = os.path.relpath(info.linkname, folderName)
+            tar.extract(memberFilter(info, targets[folderName]), targets[folderName])
+    finally:
+        tar.close()
+
+    # Longest first: an old prefix may contain another one
+    replacements = sorted(((metadata["prefixes"][key].encode("utf-8"),
+                            targets[key].encode("utf-8")) for key in targets),
+                          key=lambda item: -len(item[0]))
+    notRelocated = []
+    for name, kind, keys in metadata["files"]:
+        folderName, relPath = name.split("/", 1)
+        path = os.path.join(targets[folderName], relPath)
+        if not relocateFile(path, kind, replacements):
+            notRelocated.append(path)
+    print("%s files relocated." % (len(metadata["files"]) - len(notRelocated)))
+    if notRelocated:
+        print("These binary files keep the original paths, the new ones are longer:")
+        for path in notRelocated:
+            print("    %s" % path)
+    return metadata
@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+"""
+Package cache shared by several installations (pip, uv and conda
+downloads) and deduplication of their identical files: files are stored
+once, by content, in the cache and the installations get reflinks (copy on
+write clones, where the filesystem supports them) or, for package files
+only, read only hardlinks to them.
+"""
+import errno
+import os
+import stat
+from multiprocessing.pool import ThreadPool
+
+from scipioninstaller.wheelhouse import fileHash
+
+# Not worth a lookup
+MIN_SIZE = 4096
+# Sources and bytecode are small and their modification times matter:
+# timestamp based .pyc files would not match a shared source
+SKIP_EXTENSIONS = (".py", ".pyc")
+# Linux ioctl cloning a whole file (FICLONE)
+FICLONE = 0x40049409
+NOT_SUPPORTED = (errno.EOPNOTSUPP, errno.EXDEV, errno.EINVAL, errno.ENOTTY,
+                 errno.EPERM)
+REFLINK = "reflink"
+HARDLINK = "hardlink"
+# Folder of the cache with the deduplicated files
+STORE_NAME = "files"
+
+
+def getCacheVars(cacheDir):
+    """ Variables making pip, uv and conda (also mamba and micromamba) keep
+    their downloads in cacheDir. uv and conda link the installed files to
+    their cache when it is in the same filesystem. """
+    return [("PIP_CACHE_DIR", os.path.join(cacheDir, "pip")),
+            ("UV_CACHE_DIR", os.path.join(cacheDir, "uv")),
+            ("CONDA_PKGS_DIRS", os.path.join(cacheDir, "conda"))]
+
+
+def reflink(source, target):
+    """ Clone source into the new file target sharing its blocks.
+    OSError if the filesystem does not support it. """
+    import fcntl
+    with open(source, "rb") as src:
+        fd = os.open(target, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        try:
+            fcntl.ioctl(fd, FICLONE, src.fileno())
+        except (IOError, OSError):
+            os.close(fd)
+            os.remove(target)
+            raise
+        os.close(fd)
+
+
+def getStorePath(storeDir, digest, mode):
+    """ Files with the same content but different (read only) permissions
+    are different entries: hardlinks share them """
+    return os.path.join(storeDir, digest[:2], "%s-%o" % (digest, mode & 0o7777))
+
+
+def getStoreInodes(storeDir):
+    inodes = set()
+    for root, dirs, files in os.walk(storeDir):
+        for fileName in files:
+            info = os.lstat(os.path.join(root, fileName))
+            inodes.add((info.st_dev, info.st_ino))
+    return inodes
+
+
+def getCandidates(folders, storeInodes):
+    """ Regular files under folders worth deduplicating, not linked to the
+    store yet, with their stat """
+    candidates = []
+    for folder in folders:
+        for root, dirs, files in os.walk(folder):
+            dirs[:] = [name for name in dirs if name != ".git"]
+            for fileName in files:
+                if fileName.endswith(SKIP_EXTENSIONS):
+                    continue
+                path = os.path.join(root, fileName)
+                info = os.lstat(path)
+                if (not stat.S_ISREG(info.st_mode) or info.st_size < MIN_SIZE
+                        or (info.st_dev, info.st_ino) in storeInodes):
+                    continue
+                candidates.append((path, info))
+    return candidates
+
+
+def getReadOnlyMode(mode):
+    return mode & 0o7777 & ~0o222
+
+
+def addToStore(path, stored, hardlink):
+    """ Add path to the store as stored: a read only reflink or, if reflinks
+    are not supported and hardlink, the file itself made read only.
+    Return the method used, None if it was not added. """
+    try:
+        reflink(path, stored)
+        os.chmod(stored, getReadOnlyMode(os.lstat(path).st_mode))
+        return REFLINK
+    except (IOError, OSError) as e:
+        if e.errno not in NOT_SUPPORTED:
+            raise
+    if not hardlink:
+        return None
+    os.chmod(path, getReadOnlyMode(os.lstat(path).st_mode))
+    os.link(path, stored)
+    return HARDLINK
+
+
+def replaceFile(path, info, stored, hardlink):
+    """ Replace path by a reflink to stored, keeping its permissions, or,
+    if reflinks are not supported and hardlink, by a hardlink to it (read
+    only). Return the method used, None if path was kept. """
+    tmpPath = "%s.dedup-%s" % (path, os.getpid())
+    try:
+        reflink(stored, tmpPath)
+        os.chmod(tmpPath, info.st_mode & 0o7777)
+        os.utime(tmpPath, (info.st_atime, info.st_mtime))
+        method = REFLINK
+    except (IOError, OSError) as e:
+        if e.errno not in NOT_SUPPORTED:
+            raise
+        if not hardlink:
+            return None
+        os.link(stored, tmpPath)
+        method = HARDLINK
+    os.rename(tmpPath, path)
+    return method
+
+
+def isUnder(path, folders):
+    return any(path.startswith(folder.rstrip(os.sep) + os.sep) for folder in folders)
+
+
+def deduplicate(folders, storeDir, workers=4, hardlinkFolders=()):
+    """ Link the files under folders to their copy in storeDir, adding the
+    ones not found. Files are reflinked, so each one can still be changed
+    on its own. Where reflinks are not supported, only the files under
+    hardlinkFolders, whose package managers replace them instead of
+    rewriting them (e.g. an environment), are hardlinked, made read only:
+    a file rewritten in place would change every installation sharing it
+    and the store. Return a dict with the number of files checked, linked
+    to a previous copy, added and kept, the bytes saved and the link
+    methods used. """
+    stats = {"checked": 0, "linked": 0, "added": 0, "kept": 0, "saved": 0,
+             "otherFilesystem": 0, "methods": []}
+    if not os.path.exists(storeDir):
+        os.makedirs(storeDir)
+    candidates = getCandidates(folders, getStoreInodes(storeDir))
+    stats["checked"] = len(candidates)
+
+    # Hashing is bound by the disk, hashlib releases the GIL
+    pool = ThreadPool(max(1, workers))
+    try:
+        digests = pool.map(lambda candidate: fileHash(candidate[0]), candidates)
+    finally:
+        pool.close()
+
+    storeDev = os.stat(storeDir).st_dev
+    for (path, info), digest in zip(candidates, digests):
+        if info.st_dev != storeDev:
+            stats["otherFilesystem"] += 1
+            continue
+        # Only readable by everybody: the mode of a hardlink is shared
+        hardlink = (isUnder(path, hardlinkFolders)
+                    and info.st_mode & 0o444 == 0o444)
+        stored = getStorePath(storeDir, digest, getReadOnlyMode(info.st_mode))
+        if not os.path.exists(stored):
+            if not os.path.exists(os.path.dirname(stored)):
+                try:
+                    os.makedirs(os.path.dirname(stored))
+                except OSError as e:  # Made by another installation meanwhile
+                    if e.errno != errno.EEXIST:
+                        raise
+            try:
+                method = addToStore(path, stored, hardlink)
+            except OSError as e:
+                if e.errno != errno.EEXIST:
+                    raise
+            else:
+                if method is None:
+                    stats["kept"] += 1
+                else:
+                    stats["added"] += 1
+                    if method not in stats["methods"]:
+                        stats["methods"].append(method)
+                continue
+        method = replaceFile(path, info, stored, hardlink)
+        if method is None:
+            stats["kept"] += 1
+            continue
+        if method not in stats["methods"]:
+            stats["methods"].append(method)
+        stats["linked"] += 1
+        # Only freed if no other link (e.g. from the conda package cache) kept it
+        if info.st_nlink == 1:
+            stats["saved"] += info.st_size
+    return stats
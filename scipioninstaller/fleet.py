@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+"""
+Fleet installations: several installations (targets) described in a json
+manifest, installed from a single process by a bounded pool of threads.
+They share what the installer discovers (programs, CPUs) and the package
+cache and git mirrors, so each artifact is downloaded once.
+
+    {"parallel": 2,
+     "defaults": {"noXmipp": true},
+     "targets": [{"path": "/opt/scipion-devel", "dev": true, "conda": true},
+                 {"name": "release", "path": "/opt/scipion", "venv": true}]}
+
+Target options are named like the installer options, without the dash, and
+parsed as them: flags take true or false, repeatable options a list.
+"""
+import json
+import os
+import sys
+import threading
+import time
+import traceback
+
+from scipioninstaller import InstallationError
+
+DEFAULT_PARALLEL = 2
+# Shared caches, next to the manifest unless it says otherwise
+CACHE_NAME = ".scipion-fleet-cache"
+OK = "ok"
+FAILED = "failed"
+# Thread names: the steps of a target run in threads named <target>/<step>
+THREAD_PREFIX = "target-"
+
+
+def readManifest(manifestFn):
+    """ Read manifestFn. Return the number of targets installed at the same
+    time, the folder of the shared caches and the targets: name and options
+    (the manifest defaults updated with the target ones). """
+    try:
+        with open(manifestFn) as fh:
+            manifest = json.load(fh)
+    except (IOError, OSError, ValueError) as e:
+        raise InstallationError("Manifest %s could not be read: %s" % (manifestFn, e))
+    if not isinstance(manifest.get("targets"), list) or not manifest["targets"]:
+        raise InstallationError("Manifest %s has no targets list." % manifestFn)
+
+    targets = []
+    names = set()
+    paths = set()
+    for index, target in enumerate(manifest["targets"]):
+        options = dict(manifest.get("defaults", {}))
+        options.update(target)
+        if "path" not in options:
+            raise InstallationError("Target %s of %s has no path." % (index + 1, manifestFn))
+        name = options.pop("name", None) or os.path.basename(
+            os.path.normpath(options["path"]))
+        path = os.path.abspath(options["path"])
+        if name in names or path in paths:
+            raise InstallationError("Target %s of %s repeats the name or path of "
+                                    "another one." % (name, manifestFn))
+        names.add(name)
+        paths.add(path)
+        targets.append((name, options))
+
+    cacheDir = manifest.get("cache") or os.path.join(
+        os.path.dirname(os.path.abspath(manifestFn)), CACHE_NAME)
+    return (int(manifest.get("parallel", DEFAULT_PARALLEL)),
+            os.path.abspath(cacheDir), targets)
+
+
+class TargetOutput(object):
+    """ sys.stdout replacement writing what each target thread, and the step
+    threads it starts, print into the target log file. Other threads write
+    to out. """
+
+    def __init__(self, out):
+        self.out = out
+        self.logs = {}
+
+    def open(self, name, logFn):
+        self.logs[THREAD_PREFIX + name] = open(logFn, "w")
+
+    def close(self, name):
+        self.logs.pop(THREAD_PREFIX + name).close()
+
+    def _getOut(self):
+        threadName = threading.current_thread().name.split("/")[0]
+        return self.logs.get(threadName, self.out)
+
+    def write(self, text):
+        self._getOut().write(text)
+
+    def flush(self):
+        self._getOut().flush()
+
+    def __getattr__(self, name):
+        return getattr(self.out, name)
+
+
+def runTargets(targets, parallel, install, logDir):
+    """ Call install(name, options) for every target, at most parallel at
+    the same time, each one printing into logDir/<name>.log. Return the
+    result of each target: name, path, status, elapsed time, launcher
+    returned by install or error, and log. """
+    if not os.path.exists(logDir):
+        os.makedirs(logDir)
+    output = TargetOutput(sys.stdout)
+    semaphore = threading.Semaphore(max(1, parallel))
+    printLock = threading.Lock()
+    results = {}
+
+    def run(name, options):
+        with semaphore:
+            logFn = os.path.join(logDir, name + ".log")
+            result = {"name": name, "path": os.path.abspath(options["path"]),
+                      "log": logFn, "error": None, "launcher": None}
+            with printLock:
+                output.out.write("Installing %s, output in %s\n" % (name, logFn))
+                output.out.flush()
+            output.open(name, logFn)
+            start = time.time()
+            try:
+                result["launcher"] = install(name, options)
+                result["status"] = OK
+            except InstallationError as e:
+                result["status"] = FAILED
+                result["error"] = str(e).split("\n")[0]
+                sys.stdout.write("%s\n" % e)
+            except Exception as e:
+                result["status"] = FAILED
+                result["error"] = "%s: %s" % (type(e).__name__, e)
+                traceback.print_exc(file=sys.stdout)
+            finally:
+                output.close(name)
+            result["elapsed"] = time.time() - start
+            results[name] = result
+            with printLock:
+                output.out.write("%s %s in %.1fs\n" % (name, result["status"], result["elapsed"]))
+                output.out.flush()
+
+    threads = [threading.Thread(target=run, args=target, name=THREAD_PREFIX + target[0])
+               for target in targets]
+    sys.stdout = output
+    try:
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        for thread in threads:
+            # Timeout so KeyboardInterrupt reaches the main thread
+            while thread.is_alive():
+                thread.join(0.5)
+    finally:
+        sys.stdout = output.out
+    return [results[name] for name, _ in targets]
+
+
+def getReport(results):
+    """ Lines of a table with the result of each target """
+    lines = ["%-20s %-7s %9s  %s" % ("target", "status", "time", "path / error")]
+    for result in results:
+        lines.append("%-20s %-7s %8.1fs  %s" % (result["name"], result["status"],
+                                                result["elapsed"], result["path"]))
+        if result["error"]:
+            lines.append("%-20s %-7s %9s  %s" % ("", "", "", result["error"]))
+    return lines
@@ -1,25 +1,89 @@
 # -*- coding: utf-8 -*-
 import os
 import argparse
+import hashlib
+import json
+import subprocess
 import sys
-
-from scipioninstaller import INSTALL_ENTRY
+import tarfile
+import time
+
+from scipioninstaller import INSTALL_ENTRY, InstallationError
+from scipioninstaller.steps import Step, StepGraph, Journal
+from scipioninstaller import wheelhouse
+from scipioninstaller import buildcache
+from scipioninstaller import resources
+from scipioninstaller import bundle
+from scipioninstaller import dedup
+from scipioninstaller import scratch
+from scipioninstaller import plugins
+from scipioninstaller import overlay
+from scipioninstaller import fleet
+from scipioninstaller.trace import Tracer, waitProcess, getFolderSize
+from scipioninstaller.steplog import StepLog
 # Virtual env programs
 from scipioninstaller.launchers import (LAUNCHER_TEMPLATE, VIRTUAL_ENV_VAR,
-                                        ACTIVATE_ENV_CMD, PYTHON_PROGRAM)
+                                        ACTIVATE_ENV_CMD, PYTHON_PROGRAM,
+                                        EXEC_LAUNCHER_TEMPLATE, ENV_PYTHON,
+                                        ENV_CHANGES)
 
 VENV_ARG = '-venv'
 
 CMD_SEP = " &&\n"
 CONDA = 'conda'
+MAMBA = 'mamba'
+MICROMAMBA = 'micromamba'
+# Conda compatible environment managers, by preference
+CONDA_SOLVERS = [MAMBA, MICROMAMBA, CONDA]
+VIRTUALENV = 'virtualenv'
+UV = 'uv'
 CONDA_ACTIVATION_CMD = "CONDA_ACTIVATION_CMD"
 SCIPION_SCRATCH = 'SCIPION_SCRATCH'
+SCIPION_GIT_MIRROR = 'SCIPION_GIT_MIRROR'
+SCIPION_GIT_SERVER = 'SCIPION_GIT_SERVER'
+SCIPION_CCACHE_DIR = 'SCIPION_CCACHE_DIR'
+SCIPION_XMIPP_CACHE = 'SCIPION_XMIPP_CACHE'
+SCIPION_PACKAGE_CACHE = 'SCIPION_PACKAGE_CACHE'
+CCACHE = 'ccache'
 SCIPION_ENV = 'scipion3'
 GIT = 'git'
 LAUNCHER_NAME = "scipion3"
+ENV_MARKER = "SCIPION_ENVIRONMENT:"
+# Variables that change with every shell, not with the activation
+VOLATILE_VARS = ["_", "SHLVL", "PWD", "OLDPWD", "PS1"]
+# Variables with lists of folders, e.g. PATH, LD_LIBRARY_PATH, XDG_DATA_DIRS
+PATH_VARS_SUFFIXES = ("PATH", "DIRS")
+JOURNAL_NAME = ".installation-journal.json"
+TRACE_NAME = ".installation-trace.json"
+# Folder with the output of each step
+LOGS_NAME = ".installation-logs"
+
+SCIPION_REPOS = ["scipion-pyworkflow", "scipion-em", "scipion-app"]
+# Files with the dependencies of a package: editable installs only need
+# to be installed again when they change
+DEPENDENCY_FILES = ["setup.py", "setup.cfg", "pyproject.toml", "requirements.txt"]
+
+# Installation steps
+ENV_STEP = "environment"
+FOLDERS_STEP = "software-folders"
+PIP_STEP = "pip-install"
+LAUNCHER_STEP = "launcher"
+CONFIG_STEP = "config"
+XMIPP_SOURCES_STEP = "xmipp-sources"
+XMIPP_BUILD_STEP = "xmipp-build"
+XMIPP_PLUGIN = "scipion-em-xmipp"
+WHEELHOUSE_STEP = "wheelhouse-download"
+BYTECODE_STEP = "bytecode"
+DEDUP_STEP = "dedup"
+SITE_STEP = "site"
+# How python checks that a .pyc is up to date, see py_compile
+PYC_INVALIDATION_MODES = ["timestamp", "checked-hash", "unchecked-hash"]
+DEFAULT_WORKERS = 4
 
 XMIPP_DEFAULT_BRANCH = "devel"
 SCIPION_DEFAULT_BRANCH = "devel"
+# Programs found in the PATH, see checkProgram
+foundPrograms = {}
 # User answers
 YES = "y"
 NO = "n"
@@ -41,48 +105,74 @@ def askForInput(message, noAsk):
         return YES
 
 
-def getEnvironmentCmd(conda, scipionHome, scipionEnv, noAsk, create=True):
+def getEnvironmentCmd(conda, scipionHome, scipionEnv, noAsk, create=True,
+                      offline=False, solver=CONDA, venvTool=VIRTUALENV):
 
     cmd = cmdfy("cd %s" % scipionHome)
 
     if conda:
-        cmd += getCondaCmd(scipionEnv, noAsk, create)
+        cmd += getCondaCmd(scipionEnv, noAsk, create, offline, solver)
     else:
-        cmd += getVirtualenvCmd(scipionHome, scipionEnv, create)
+        cmd += getVirtualenvCmd(scipionHome, scipionEnv, create, venvTool)
 
     return cmd
 
 
-class InstallationError(Exception):
-    pass
-
+def getCondaCmd(scipionEnv, noAsk, create, offline=False, solver=CONDA):
+    """ Command creating (with solver: conda, mamba or micromamba) and
+    activating the environment """
 
-def getCondaCmd(scipionEnv, noAsk, create):
-
-    cmd = cmdfy(getCondaInitCmd())
+    cmd = cmdfy(getCondaInitCmd(solver=solver))
     if create:
-        silentMode = "-y" if noAsk else ""
-        cmd += cmdfy("%s create %s -n %s python=3.8" % (CONDA, silentMode, scipionEnv))
-    cmd += cmdfy(getCondaenvActivationCmd(scipionEnv))
+        createCmd = [solver, "create"]
+        if noAsk:
+            createCmd.append("-y")
+        if offline:
+            createCmd.append("--offline")
+        createCmd.append("-n %s python=3.8" % scipionEnv)
+        # micromamba has no default channels
+        if solver == MICROMAMBA:
+            createCmd.append("-c conda-forge")
+        cmd += cmdfy(" ".join(createCmd))
+    cmd += cmdfy(getCondaenvActivationCmd(scipionEnv, solver))
     return cmd
 
 
-def getCondaInitCmd(doRaise=True):
+def guessCondaSolver():
+    """ First conda compatible environment manager found, favouring the
+    faster ones: mamba, micromamba, conda. None if there is none. """
+
+    for solver in CONDA_SOLVERS:
+        if checkProgram(solver, doRaise=False):
+            return solver
+    return None
+
+
+def getActivationProgram(solver):
+    """ mamba environments are activated by conda, micromamba ones by
+    micromamba itself """
+    return MICROMAMBA if solver == MICROMAMBA else CONDA
+
+
+def getCondaInitCmd(doRaise=True, solver=CONDA):
 
     conda_init = os.environ.get(CONDA_ACTIVATION_CMD, None)
 
-    if conda_init is None:
-        return guessCondaInitCmd(doRaise)
+    if conda_init is None or getActivationProgram(solver) != CONDA:
+        return guessCondaInitCmd(doRaise, solver)
     else:
         return conda_init
 
 
-def guessCondaInitCmd(doRaise=True):
+def guessCondaInitCmd(doRaise=True, solver=CONDA):
 
     shell = os.path.basename(os.environ.get("SHELL", "bash"))
-    condaPath = checkProgram(CONDA, doRaise)
+    program = getActivationProgram(solver)
+    condaPath = checkProgram(program, doRaise)
     if not condaPath:
         return ""
+    if program == MICROMAMBA:
+        return 'eval "$(%s shell hook -s %s)"' % (condaPath, shell)
     if shell in ["csh", "tcsh", "zsh"]:
         return '. "%s"' % os.path.join(os.path.dirname(condaPath), "..", "etc",
                                        "profile.d", "conda.sh")
@@ -90,9 +180,9 @@ def guessCondaInitCmd(doRaise=True):
         return 'eval "$(%s shell.%s hook)"' % (condaPath, shell)
 
 
-def getCondaenvActivationCmd(scipionEnv):
+def getCondaenvActivationCmd(scipionEnv, solver=CONDA):
 
-    return "conda activate %s" % scipionEnv
+    return "%s activate %s" % (getActivationProgram(solver), scipionEnv)
 
 
 def cmdfy(cmd, sep=CMD_SEP):
@@ -100,11 +190,15 @@ def cmdfy(cmd, sep=CMD_SEP):
     return cmd + sep
 
 
-def getVirtualenvCmd(scipionHome, scipionEnv, create):
+def getVirtualenvCmd(scipionHome, scipionEnv, create, venvTool=VIRTUALENV):
     cmd = ""
     if create:
-        cmd += cmdfy("%s -m virtualenv --python=python3 %s" % (sys.executable,
-                                                               scipionEnv))
+        if venvTool == UV:
+            # Seeded with pip, so plain pip keeps working in the environment
+            cmd += cmdfy("%s venv --seed --python python3 %s" % (UV, scipionEnv))
+        else:
+            cmd += cmdfy("%s -m virtualenv --python=python3 %s" % (sys.executable,
+                                                                   scipionEnv))
 
     cmd += cmdfy(getVirtualenvActivationCmd(scipionHome, scipionEnv))
     return cmd
@@ -118,15 +212,19 @@ def checkProgram(program, doRaise=True):
     """Check whether `name` is on PATH.
     :param doRaise: (True) - raise an exception if not found otherwise, return empty string """
 
-    try:
-        from shutil import which
+    # Looked up once for all the installations of the process (see fleet)
+    key = (program, os.environ.get("PATH"))
+    if key not in foundPrograms:
+        try:
+            from shutil import which
 
-        fullPath = which(program)
+            foundPrograms[key] = which(program)
 
-    # Python 2 case:
-    except Exception as e:
-        from distutils.spawn import find_executable
-        fullPath = find_executable(program)
+        # Python 2 case:
+        except Exception as e:
+            from distutils.spawn import find_executable
+            foundPrograms[key] = find_executable(program)
+    fullPath = foundPrograms[key]
 
     if fullPath is None:
         if doRaise:
@@ -155,21 +253,31 @@ def solveFolder(folder, dry):
 
 def getRepoInstallCommand(scipionHome, repoName, useHttps,
                           organization='scipion-em', branch='devel',
-                          pipInstall=True, cloneFolder=''):
-    
-    # Choose url type: ssh or https
-    cloneUrl= 'git@github.com:%s/%s.git' if not useHttps else 'https://github.com/%s/%s.git'
-
-    # replace the repository name
-    cloneUrl = cloneUrl % (organization, repoName)
+                          pipInstall=True, cloneFolder='', cloneOptions='',
+                          unshallow=False, mirror=None):
+    """ Command to clone the repository or, if already there, update it.
+    :param cloneOptions: extra git clone options, see getGitOptions
+    :param unshallow: fetch the full history of an existing shallow,
+    single branch clone before updating it
+    :param mirror: local bare mirror of the repository, objects are taken
+    from it instead of downloading them (see getMirrorCmd) """
+
+    cloneUrl = getCloneUrl(organization, repoName, useHttps)
     folderName = repoName if cloneFolder == '' else cloneFolder
 
     if not os.path.exists(os.path.join(scipionHome, folderName)):
-        cmd = cmdfy("git clone --branch %s %s %s" % (branch, cloneUrl,
-                                                     cloneFolder))
+        if mirror is not None:
+            cloneOptions = ("--reference %s --dissociate %s" % (mirror, cloneOptions)).strip()
+        cmd = cmdfy("git clone %s--branch %s %s %s" % (
+            cloneOptions + " " if cloneOptions else "", branch, cloneUrl,
+            cloneFolder))
     else:
-        print("%s repository detected, it will be updated." % folderName)
-        cmd = cmdfy("cd %s" % folderName)
+        # Shown when the step runs: with the journal it may be skipped
+        cmd = cmdfy("echo '%s repository detected, updating it.'" % folderName)
+        cmd += cmdfy("cd %s" % folderName)
+        if unshallow:
+            cmd += getUnshallowCmd()
+        # Shallow clones stay so: only the new commits are fetched
         cmd += cmdfy("git pull")
         cmd += cmdfy("cd ..")
 
@@ -179,70 +287,635 @@ def getRepoInstallCommand(scipionHome, repoName, useHttps,
     return cmd
 
 
-def getScipionInstallationCmd(scipionHome, dev, args):
+def getCloneUrl(organization, repoName, useHttps):
+    """ Url of a repository: github through ssh or https unless
+    SCIPION_GIT_SERVER points to another server, e.g. file:///path/to/repos
+    holding <organization>/<repoName>.git bare repositories. """
 
-    cmd = cmdfy("mkdir -p software/lib")
-    cmd += cmdfy("mkdir -p software/bindings")
-    cmd += cmdfy("mkdir -p software/em")
-    cmd += cmdfy("export SCIPION_HOME=%s" % scipionHome)
+    server = os.environ.get(SCIPION_GIT_SERVER, None)
+    if server:
+        return "%s/%s/%s.git" % (server.rstrip("/"), organization, repoName)
+
+    # Choose url type: ssh or https
+    cloneUrl = 'git@github.com:%s/%s.git' if not useHttps else 'https://github.com/%s/%s.git'
+
+    # replace the repository name
+    return cloneUrl % (organization, repoName)
+
+
+def getMirrorPath(mirrorDir, organization, repoName):
+    return os.path.join(mirrorDir, organization, repoName + ".git")
+
+
+def getMirrorCmd(mirrorPath, cloneUrl):
+    """ Command to create a bare mirror of cloneUrl at mirrorPath or, if
+    it exists, fetch incrementally the new objects into it """
+
+    cmd = cmdfy("mkdir -p %s" % os.path.dirname(mirrorPath))
+    update = ("if [ -d %(mirror)s ]; then git --git-dir=%(mirror)s fetch --prune origin; "
+              "else git clone --mirror %(url)s %(mirror)s; fi"
+              % {"mirror": mirrorPath, "url": cloneUrl})
+    if checkProgram("flock", doRaise=False):
+        # Installations sharing the mirror may update it at the same time
+        update = "flock %s.lock sh -c '%s'" % (mirrorPath, update)
+    cmd += cmdfy(update)
+    return cmd
+
+
+def getRepoSteps(scipionHome, repoName, useHttps, args, organization='scipion-em',
+                 branch='devel', cloneFolder='', cloneCmdPrefix=''):
+    """ Steps cloning or updating a repository: a single clone step or,
+    when a git mirror folder is used, a mirror update step followed by the
+    clone step. The clone step is the last one. """
+
+    cloneOptions = getGitOptions(args)
+    steps = []
+    mirror = None
+    if args.gitMirror:
+        mirror = getMirrorPath(args.gitMirror, organization, repoName)
+        steps.append(Step("mirror-" + repoName,
+                          getMirrorCmd(mirror, getCloneUrl(organization, repoName, useHttps)),
+                          env=False, refresh=args.update))
+
+    cloneInputs = {"url": getCloneUrl(organization, repoName, useHttps),
+                   "branch": branch, "folder": cloneFolder or repoName,
+                   "cloneOptions": cloneOptions, "unshallow": args.unshallow,
+                   "mirror": mirror}
+    repoPath = os.path.join(scipionHome, cloneFolder or repoName)
+    steps.append(Step("clone-" + repoName, cloneCmdPrefix +
+                      getRepoInstallCommand(scipionHome, repoName, useHttps,
+                                            organization=organization,
+                                            branch=branch,
+                                            pipInstall=False,
+                                            cloneFolder=cloneFolder,
+                                            cloneOptions=cloneOptions,
+                                            unshallow=args.unshallow,
+                                            mirror=mirror),
+                      deps=[step.name for step in steps], env=False,
+                      inputs=cloneInputs, refresh=args.update,
+                      state=lambda: getRepoState(repoPath)))
+    return steps
+
+
+def getRepoState(repoPath):
+    """ Commit of a repository and hash of its dependency files (local
+    changes included), None if unknown """
+    try:
+        commit = buildcache.runOutput(["git", "rev-parse", "HEAD"], repoPath)
+    except (subprocess.CalledProcessError, OSError):
+        return None
+    sha = hashlib.sha256()
+    for fileName in DEPENDENCY_FILES:
+        path = os.path.join(repoPath, fileName)
+        if os.path.exists(path):
+            with open(path, "rb") as fh:
+                sha.update(fileName.encode() + b"\0" + fh.read())
+    return {"commit": commit, "dependencies": sha.hexdigest()}
+
+
+def getGitOptions(args):
+    """ Clone options reducing the transferred history: shallow
+    (-cloneDepth), -singleBranch and blobless (-blobless) clones. Pulls
+    need none: they only fetch the new commits. With -unshallow, the
+    history is not limited. """
+
+    cloneOptions = []
+    if args.unshallow:
+        return ""
+    if args.cloneDepth:
+        cloneOptions.append("--depth %s" % args.cloneDepth)
+    if args.singleBranch:
+        cloneOptions.append("--single-branch")
+    if args.blobless:
+        cloneOptions.append("--filter=blob:none")
+    return " ".join(cloneOptions)
+
+
+def getUnshallowCmd():
+    """ Command to get the full history of a shallow and/or single
+    branch clone, to be run inside the repository """
+
+    cmd = cmdfy('git config remote.origin.fetch "+refs/heads/*:refs/remotes/origin/*"')
+    cmd += cmdfy('if [ "$(git rev-parse --is-shallow-repository)" = true ]; '
+                 'then git fetch --unshallow origin; else git fetch origin; fi')
+    return cmd
+
+
+def getScipionInstallationSteps(scipionHome, dev, args):
+    """ Steps preparing scipion core: software folders and, in devel mode,
+    the repositories. Clones are independent of each other and of the
+    environment creation. Packages are installed by the pip step. """
+
+    steps = [Step(FOLDERS_STEP, cmdfy("mkdir -p software/lib") +
+                  cmdfy("mkdir -p software/bindings") +
+                  cmdfy("mkdir -p software/em"), env=False)]
 
     if dev:
         useHttps = args.httpsClone
 
         # Scipion repos
-        cmd += getRepoInstallCommand(scipionHome, "scipion-pyworkflow", useHttps, branch=args.sciBranch)
-        cmd += getRepoInstallCommand(scipionHome, "scipion-em", useHttps, branch=args.sciBranch)
-        cmd += getRepoInstallCommand(scipionHome, "scipion-app", useHttps, branch=args.sciBranch)
-
-    else:
-        cmd += cmdfy("pip install scipion-pyworkflow")
-        cmd += cmdfy("pip install scipion-app")
+        for repoName in SCIPION_REPOS:
+            steps.extend(getRepoSteps(scipionHome, repoName, useHttps, args,
+                                      branch=args.sciBranch))
 
-    return cmd
+    return steps
 
 
-def getXmippInstallationCmd(scipionHome, dev, args):
+def getXmippInstallationSteps(scipionHome, dev, args, jobs=None, dry=False):
+    """ Steps installing Xmipp. Sources are fetched while scipion core is
+    being installed, the build waits for the pip step and the config file.
+    The build uses jobs CPUs, -j by default. """
 
-    cmd = cmdfy("export SCIPION_HOME=%s" % scipionHome)
+    jobs = jobs or args.j
     if dev:
         useHttps = args.httpsClone
         # Xmipp repos
-        cmd += cmdfy("echo '\033[1m\033[95m > Installing Xmipp-dev ...\033[0m'")
-        cmd += getRepoInstallCommand(scipionHome, "xmipp", useHttps,
-                                     organization='i2pc',
-                                     branch=args.xmippBranch,
-                                     pipInstall=False,
-                                     cloneFolder='xmipp-bundle')
-        cmd += cmdfy("xmipp-bundle/xmipp get_devel_sources %s" % args.xmippBranch)
-        cmd += cmdfy("xmipp-bundle/xmipp config %s" % ('noAsk' if args.noAsk else ''))  # This reset the xmipp.conf
-        cmd += cmdfy("pip install -e xmipp-bundle/src/scipion-em-xmipp")
-        cmd += cmdfy("python -m scipion installb xmippDev -j %s" % args.j)
+        repoSteps = getRepoSteps(scipionHome, "xmipp", useHttps, args,
+                                 organization='i2pc',
+                                 branch=args.xmippBranch,
+                                 cloneFolder='xmipp-bundle',
+                                 cloneCmdPrefix=cmdfy("echo '\033[1m\033[95m > Installing Xmipp-dev ...\033[0m'"))
+        cloneStep = repoSteps[-1]
+        sourcesStep = Step(XMIPP_SOURCES_STEP,
+                           cmdfy("xmipp-bundle/xmipp get_devel_sources %s" % args.xmippBranch),
+                           deps=[ENV_STEP, cloneStep.name], refresh=args.update,
+                           state=lambda: dict((os.path.relpath(repo, scipionHome),
+                                               getRepoState(repo))
+                                              for repo in buildcache.getXmippRepos(scipionHome)))
+        # Compilers found by xmipp config and used by the build go through ccache
+        compilerCmd = ""
+        if args.ccache:
+            for var, value in buildcache.getCcacheVars(args.ccache):
+                compilerCmd += cmdfy("export %s=%s" % (var, value))
+        # This reset the xmipp.conf
+        configStep = Step("xmipp-config", compilerCmd +
+                          cmdfy("xmipp-bundle/xmipp config %s" % ('noAsk' if args.noAsk else '')),
+                          deps=[sourcesStep.name, PIP_STEP],
+                          state=lambda: buildcache.readXmippConf(scipionHome))
+        buildStep = Step(XMIPP_BUILD_STEP, compilerCmd +
+                         cmdfy("python -m scipion installb xmippDev -j %s" % jobs),
+                         deps=[sourcesStep.name, configStep.name, FOLDERS_STEP,
+                               CONFIG_STEP], cpus=jobs)
+        steps = repoSteps + [sourcesStep, configStep]
+        if args.xmippCache:
+            steps += getXmippCacheSteps(scipionHome, args.xmippCache, buildStep, dry)
+        else:
+            steps.append(buildStep)
+        return steps
     else:
-       cmd += cmdfy("python -m scipion installp -p scipion-em-xmipp -j %s" % args.j)
+        # scipion-em-xmipp is already installed by the pip step
+        return [Step(XMIPP_BUILD_STEP,
+                     cmdfy("python -m scipion installp -p %s -j %s" % (XMIPP_PLUGIN, jobs)),
+                     deps=[PIP_STEP, FOLDERS_STEP, CONFIG_STEP], cpus=jobs)]
 
-    return cmd
 
+def getPluginSteps(pluginList, jobs):
+    """ Steps building the binaries of the plugins, already installed by
+    the pip step, each one with its jobs """
+    return [Step("plugin-" + plugin["name"],
+                 cmdfy("python -m scipion installp -p %s -j %s" % (plugin["name"], pluginJobs)),
+                 deps=[PIP_STEP, FOLDERS_STEP, CONFIG_STEP], cpus=pluginJobs)
+            for plugin, pluginJobs in zip(pluginList, jobs)]
 
-def createLauncher(scipionHome, conda, dry, scipionEnv, devel=False):
 
-    if devel:
-        # TODO: Contemplate different launcher template (ex: scipion3 git [options])
-        content = LAUNCHER_TEMPLATE
+def getXmippCacheSteps(scipionHome, cacheDir, buildStep, dry=False):
+    """ Wrap the Xmipp build step: when it has to run, the build with the
+    same key (commits, compiler and xmipp.conf) is restored from cacheDir
+    instead, if found there, and a new build is saved there otherwise.
+    A build recorded as done by the journal is neither restored nor saved. """
+
+    state = {"key": None, "restored": False}
+
+    def restore():
+        # Only called when the build would run, see runInstallationGraph
+        state["key"] = buildcache.getXmippCacheKey(scipionHome)
+        try:
+            state["restored"] = buildcache.restoreXmippBuild(scipionHome, cacheDir,
+                                                             state["key"])
+        except (IOError, OSError, tarfile.TarError) as e:
+            raise InstallationError("Xmipp build could not be restored from %s: %s"
+                                    % (cacheDir, e))
+        return state["restored"]
+
+    def save():
+        if dry:
+            print("The Xmipp build would have been restored from or saved in %s."
+                  % cacheDir)
+        elif state["key"] is not None and not state["restored"]:
+            try:
+                buildcache.saveXmippBuild(scipionHome, cacheDir, state["key"])
+            except (IOError, OSError, tarfile.TarError) as e:
+                raise InstallationError("Xmipp build could not be saved in %s: %s"
+                                        % (cacheDir, e))
+
+    buildStep.skipIf = restore
+    saveStep = Step("xmipp-cache-save", func=save, deps=[buildStep.name])
+    return [buildStep, saveStep]
+
+
+def getPipPackages(dev, args):
+    """ pip requirements of the installation: package names or, in devel
+    mode, editable (-e) repositories """
+
+    if dev:
+        packages = ["-e " + repoName for repoName in SCIPION_REPOS]
+        if not args.noXmipp:
+            packages.append("-e xmipp-bundle/src/scipion-em-xmipp")
     else:
-        content = LAUNCHER_TEMPLATE
+        packages = ["scipion-pyworkflow", "scipion-app"]
+        if not args.noXmipp:
+            packages.append(XMIPP_PLUGIN)
+    # Plugin branches come from their git repositories
+    packages += [plugins.getRequirement(plugin, getCloneUrl("scipion-em", plugin["name"], True))
+                 for plugin in args.pluginList]
+    return packages
+
+
+def getPipProgram(args):
+    """ pip, or uv pip when the virtualenv is managed by uv """
+    return "%s pip" % UV if args.venvTool == UV else "pip"
+
+
+def getPipInstallStep(packages, deps, pip="pip", sources=None):
+    """ Step installing all the packages in a single pip call, so there is
+    a single dependency resolution. If it fails, packages are installed one
+    by one to find out which one is the culprit: the one failing to install
+    or breaking (pip check) the requirements of the previous ones.
+    :param sources: when updating, the step providing each (editable)
+    package: only the packages whose step changed are installed again """
+
+    cmd = cmdfy("%s install %s" % (pip, " ".join(packages)))
+    inputs = {"cmd": cmd}
+
+    def getUpdateCmd(changedDeps):
+        updated = [package for package in packages
+                   if sources.get(package) in changedDeps]
+        # Everything if it did not finish last time or the environment changed
+        if (not changedDeps or len(updated) == len(packages)
+                or any(dep not in sources.values() for dep in changedDeps)):
+            return cmd
+        print("Installing again only %s" % ", ".join(updated))
+        return cmdfy("%s install %s" % (pip, " ".join(updated)))
+
+    return Step(PIP_STEP, cmd if sources is None else getUpdateCmd,
+                deps=deps, inputs=inputs,
+                fallback=[cmdfy("%s install %s" % (pip, package)) + cmdfy("%s check" % pip)
+                          for package in packages])
+
+
+def getBytecodeStep(dev, args):
+    """ Step compiling in parallel the bytecode of the installed packages
+    and of the editable repositories, so the first launch does not have to
+    (nor can fail to, in read only installations). Editable repositories
+    are always checked by timestamp: their sources are edited. Environments
+    older than python 3.7 only have timestamp bytecode. """
+
+    compileCmd = "python -m compileall -q -j %s" % args.j
+    failedMsg = "echo 'Some files could not be compiled, python will compile them when used.'"
+    sitePackages = '"$(python -c "import sysconfig; print(sysconfig.get_paths()[\'purelib\'])")"'
+    invalidation = "--invalidation-mode %s" % args.pycInvalidation
+    if args.pycInvalidation != PYC_INVALIDATION_MODES[0]:
+        # pip compiled them by timestamp, they would be taken as up to date
+        invalidation += " -f"
+    # Left out, not failing the whole compilation, where it is not known
+    invalidation = ("$(python -c 'import sys; print(\"%s\" if sys.version_info >= (3, 7) else \"\")')"
+                    % invalidation)
+    cmd = cmdfy("%s %s %s || %s" % (compileCmd, invalidation, sitePackages, failedMsg))
+    if dev:
+        repos = [package[len("-e "):] for package in getPipPackages(dev, args)
+                 if package.startswith("-e ")]
+        cmd += cmdfy("%s %s || %s" % (compileCmd, " ".join(repos), failedMsg))
+    return Step(BYTECODE_STEP, cmd, deps=[PIP_STEP], cpus=args.j)
+
+
+def getInstallationGraph(scipionHome, conda, scipionEnv, dev, args, dry):
+    """ Build the whole installation graph: environment, scipion core,
+    launcher, config file and, optionally, Xmipp """
+
+    graph = StepGraph()
+    graph.add(Step(ENV_STEP, getEnvironmentCmd(conda, scipionHome, scipionEnv,
+                                               args.noAsk, offline=args.offline,
+                                               solver=args.solver,
+                                               venvTool=args.venvTool),
+                   env=False))
+
+    for step in getScipionInstallationSteps(scipionHome, dev, args):
+        graph.add(step)
+
+    pipDeps = [ENV_STEP]
+    pipSources = None
+    if dev:
+        pipDeps += ["clone-" + repoName for repoName in SCIPION_REPOS]
+        if not args.noXmipp:
+            pipDeps.append(XMIPP_SOURCES_STEP)
+        if args.update:
+            pipSources = dict(zip(getPipPackages(dev, args), pipDeps[1:]))
+    graph.add(getPipInstallStep(getPipPackages(dev, args), pipDeps,
+                                getPipProgram(args), pipSources))
+
+    graph.add(getBytecodeStep(dev, args))
 
+    def launcherStep():
+        createLauncher(scipionHome, conda, dry, scipionEnv, args.solver)
+        print("------------------------------------")
+        print("Scipion core successfully installed.")
+        print("------------------------------------")
+
+    graph.add(Step(LAUNCHER_STEP, func=launcherStep, deps=[PIP_STEP]))
+    # Creating a minimum Scipion config file
+    graph.add(Step(CONFIG_STEP,
+                   func=lambda: createConfigFile(scipionHome, args.scratchPath, dry,
+                                                 args.solver)))
+
+    # Binary builds run at the same time sharing the -j CPUs, the
+    # biggest share for Xmipp
+    builds = len(args.pluginList) + (0 if args.noXmipp else 1)
+    jobs = plugins.getBuildJobs(builds, args.j) if builds else []
+    if not args.noXmipp:
+        for step in getXmippInstallationSteps(scipionHome, dev, args, jobs.pop(0), dry):
+            graph.add(step)
+    for step in getPluginSteps(args.pluginList, jobs):
+        graph.add(step)
+
+    if args.dedup:
+        graph.add(getDedupStep(scipionHome, conda, scipionEnv, args, dry,
+                               [step.name for step in graph]))
+    if args.site:
+        graph.add(getSiteStep(scipionHome, conda, scipionEnv, dev, args, dry,
+                              [step.name for step in graph]))
+
+    return graph
+
+
+def getDedupStep(scipionHome, conda, scipionEnv, args, dry, deps):
+    """ Step linking the files of the environment and software folder to
+    their copies in the package cache, once everything is installed """
+
+    storeDir = os.path.join(args.packageCache, dedup.STORE_NAME)
+
+    def deduplicate():
+        if dry:
+            print("Files of the environment and %s would have been linked to "
+                  "their copies in %s" % (os.path.join(scipionHome, "software"),
+                                          storeDir))
+            return
+        envPrefix = getEnvPrefix(scipionHome, conda, scipionEnv, args.solver)
+        folders = [envPrefix, os.path.join(scipionHome, "software")]
+        # Builds may rewrite the files of software: they are only reflinked
+        stats = dedup.deduplicate(folders, storeDir, args.j, hardlinkFolders=[envPrefix])
+        content = ["%s files checked in %s" % (stats["checked"], ", ".join(folders)),
+                   "%s files added to %s" % (stats["added"], storeDir),
+                   "%s files linked (%s) to identical ones, %.1f MB saved"
+                   % (stats["linked"], ", ".join(stats["methods"]) or "-",
+                      stats["saved"] / 1024.0 ** 2)]
+        if stats["kept"]:
+            content.append("%s files kept as they are: they can only be shared "
+                           "by reflinks, not supported here" % stats["kept"])
+        if stats["otherFilesystem"]:
+            content.append("%s files skipped: not in the filesystem of %s"
+                           % (stats["otherFilesystem"], storeDir))
+        createMessageInstallation("Deduplication", content)
+
+    return Step(DEDUP_STEP, func=deduplicate, deps=deps)
+
+
+def getSiteStep(scipionHome, conda, scipionEnv, dev, args, dry, deps):
+    """ Step describing the site installation for its user overlays (see
+    -base) and making it readable by every user, once everything is
+    installed """
+
+    def describeSite():
+        if dry:
+            print("%s would have been written and %s made readable by every user."
+                  % (os.path.join(scipionHome, overlay.SITE_NAME), scipionHome))
+            return
+        envPrefix = getEnvPrefix(scipionHome, conda, scipionEnv, args.solver)
+        envPython = os.path.join(envPrefix, "bin", "python")
+        if conda:
+            # By path: users may not have the environment in their conda
+            activationCmd = (getCondaInitCmd(solver=args.solver) + " && "
+                             + getCondaenvActivationCmd(envPrefix, args.solver))
+        else:
+            activationCmd = getVirtualenvActivationCmd(scipionHome, scipionEnv)
+        overlay.writeSiteMetadata(scipionHome, {
+            "conda": conda, "devel": dev, "envPrefix": envPrefix,
+            "envPython": envPython, "activation": activationCmd,
+            "condaInit": getCondaInitCmd(False, args.solver),
+            "siteDirs": overlay.getSiteDirs(envPython)})
+        folders = [scipionHome]
+        if not envPrefix.startswith(scipionHome + os.sep):
+            folders.append(envPrefix)
+        runCmd("chmod -R a+rX,go-w %s" % " ".join(folders), dry)
+
+    return Step(SITE_STEP, func=describeSite, deps=deps)
+
+
+def getWheelhousePackages(dev, args):
+    """ Packages installed with pip for this configuration: names or, in
+    devel mode, the local repositories whose dependencies are needed """
+
+    return [package.replace("-e ", "./") for package in getPipPackages(dev, args)]
+
+
+def getWheelhouseGraph(scipionHome, conda, scipionEnv, dev, args, dry):
+    """ Graph creating the environment (for its python and platform) and,
+    in devel mode, getting the sources, to download into the wheelhouse
+    every distribution the installation needs and write its manifest """
+
+    graph = StepGraph()
+    graph.add(Step(ENV_STEP, getEnvironmentCmd(conda, scipionHome, scipionEnv,
+                                               args.noAsk, solver=args.solver,
+                                               venvTool=args.venvTool),
+                   env=False))
+    deps = [ENV_STEP]
+    if dev:
+        for repoName in SCIPION_REPOS:
+            for step in getRepoSteps(scipionHome, repoName, args.httpsClone, args,
+                                     branch=args.sciBranch):
+                graph.add(step)
+            deps.append(step.name)
+        if not args.noXmipp:
+            # Only the steps getting the sources
+            xmippSteps = getXmippInstallationSteps(scipionHome, dev, args)
+            names = [step.name for step in xmippSteps]
+            for step in xmippSteps[:names.index(XMIPP_SOURCES_STEP) + 1]:
+                graph.add(step)
+            deps.append(XMIPP_SOURCES_STEP)
+
+    packages = getWheelhousePackages(dev, args)
+    wheelhouseDir = args.buildWheelhouse
+    graph.add(Step(WHEELHOUSE_STEP,
+                   cmdfy(wheelhouse.getDownloadCmd(wheelhouseDir, packages)),
+                   deps=deps))
+    def manifestStep():
+        if dry:
+            print("%s and %s would have been written in %s." % (
+                wheelhouse.MANIFEST_NAME, wheelhouse.LOCK_NAME, wheelhouseDir))
+        else:
+            wheelhouse.writeManifest(wheelhouseDir, packages)
+
+    graph.add(Step("wheelhouse-manifest", func=manifestStep,
+                   deps=[WHEELHOUSE_STEP]))
+    return graph
+
+
+def runInstallationGraph(graph, scipionHome, envCmd, workers, dry,
+                         journal=None, tracer=None, logDir=None, echo=True,
+                         cpus=None):
+    """ Run the graph steps from scipionHome, commands needing the
+    environment are prefixed with envCmd. Steps recorded in the journal
+    with the same inputs are skipped, unless they are refreshed or one of
+    their dependencies has changed something: a command run again whose
+    state is not the recorded one (python steps never count). Time and resources of each step go to the tracer. The output
+    of each step goes to a log file in logDir and, if echo, to the terminal.
+    Steps using CPUs share a budget of cpus. In dry mode, the graph and its commands are shown. """
+
+    changed = set()
+
+    def getInputs(step):
+        inputs = step.getInputs()
+        if inputs is not None and step.env:
+            inputs = dict(inputs, environment=envCmd)
+        return inputs
+
+    def isDone(step):
+        return (journal is not None and not step.refresh
+                and not any(dep in changed for dep in step.deps)
+                and journal.isDone(step.name, getInputs(step)))
+
+    # Lines are written at once: steps run in parallel
+    def skip(step, reason):
+        sys.stdout.write("%s %s, skipping it.\n" % (step.name, reason))
+        if tracer is not None:
+            tracer.skipStep(step.name, reason)
+
+    def runStep(step, record):
+        if step.func is not None:
+            step.func()
+            return
+        cmd = step.getCmd(dep for dep in step.deps if dep in changed)
+        prefix = envCmd if step.env else cmdfy("cd %s" % scipionHome)
+        log = None
+        if logDir is not None:
+            log = StepLog(step.name, os.path.join(logDir, step.name + ".log"), echo)
+            sys.stdout.write("Running %s, output in %s\n" % (step.name, log.logFn))
+        sys.stdout.flush()
+        try:
+            usage = runCmd(prefix + cmd, dry, step.name, log)
+        except InstallationError:
+            if not step.fallback:
+                raise
+            print("%s failed, running its commands one by one." % step.name)
+            for cmd in step.fallback:
+                sys.stdout.flush()
+                try:
+                    usage = runCmd(prefix + cmd, dry, step.name, log)
+                except InstallationError as e:
+                    raise InstallationError("%s failed at: %s\n%s"
+                                            % (step.name, cmd.split(CMD_SEP)[0], e))
+                if record is not None:
+                    tracer.addUsage(record, usage)
+        else:
+            if record is not None:
+                tracer.addUsage(record, usage)
+
+    def execute(step):
+        if isDone(step):
+            skip(step, "already done")
+            return
+        if step.skipIf is not None and step.skipIf():
+            skip(step, "not needed")
+            # Its outputs are there (e.g. restored from a cache): it is done
+            changed.add(step.name)
+            if journal is not None and getInputs(step) is not None:
+                journal.record(step.name, getInputs(step), 0)
+            return
+        previousState = None
+        if journal is not None:
+            previousState = journal.getState(step.name)
+            journal.forget(step.name)
+        start = time.time()
+        record = tracer.startStep(step.name) if tracer is not None else None
+        try:
+            runStep(step, record)
+        except BaseException:
+            if record is not None:
+                tracer.endStep(record, "failed")
+            raise
+        if record is not None:
+            tracer.endStep(record)
+        state = step.state() if step.state is not None else None
+        if step.func is None:
+            sys.stdout.write("%s finished in %.1fs\n" % (step.name, time.time() - start))
+            if state is not None and state == previousState:
+                sys.stdout.write("%s did not change anything.\n" % step.name)
+            else:
+                changed.add(step.name)
+        if journal is not None and getInputs(step) is not None:
+            journal.record(step.name, getInputs(step), time.time() - start,
+                           state)
+
+    if dry:
+        graph.show()
+        print("Steps needing the environment are preceded by:")
+        runCmd(envCmd, dry)
+        for wave in graph.waves():
+            for step in wave:
+                if isDone(step):
+                    print("# %s (already done, it would be skipped)" % step.name)
+                    continue
+                print("# %s" % step.name)
+                if step.func is not None:
+                    step.func()
+                else:
+                    changed.add(step.name)
+                    runCmd(step.getCmd(dep for dep in step.deps if dep in changed),
+                           dry)
+                    if step.fallback:
+                        print("# if %s fails, one by one:" % step.name)
+                        for cmd in step.fallback:
+                            runCmd(cmd, dry)
+    else:
+        graph.run(workers, execute, cpus)
+
+
+def createLauncher(scipionHome, conda, dry, scipionEnv, solver=CONDA,
+                   activationCmd=None):
+    """ Write the launcher of the installation. activationCmd replaces
+    the activation of its environment, e.g. for overlays. """
+
+    # Activating the environment at every launch, unless it can be captured
+    content = LAUNCHER_TEMPLATE
     pythonProgram = os.path.basename(sys.executable)
 
-    condaInit = getCondaInitCmd(doRaise=False)
+    condaInit = getCondaInitCmd(doRaise=False, solver=solver)
 
     if conda:
         replaceDict = {VIRTUAL_ENV_VAR: "CONDA_DEFAULT_ENV",
-                       ACTIVATE_ENV_CMD: condaInit + " && " + getCondaenvActivationCmd(scipionEnv),
+                       ACTIVATE_ENV_CMD: condaInit + " && " + getCondaenvActivationCmd(scipionEnv, solver),
                        PYTHON_PROGRAM: str(pythonProgram)}
     else:
         replaceDict = {VIRTUAL_ENV_VAR: "VIRTUAL_ENV",
                        ACTIVATE_ENV_CMD: getVirtualenvActivationCmd(scipionHome, scipionEnv),
                        PYTHON_PROGRAM: str(pythonProgram)}
+    if activationCmd is not None:
+        replaceDict[ACTIVATE_ENV_CMD] = activationCmd
+
+    # Use the environment activated once, now, instead of activating it
+    # at every launch
+    activationCmd = replaceDict[ACTIVATE_ENV_CMD]
+    if dry:
+        print("The launcher would run the python of the environment activated by: %s"
+              % activationCmd)
+    else:
+        try:
+            envPython, envChanges = captureEnvironment(activationCmd)
+            content = EXEC_LAUNCHER_TEMPLATE
+            replaceDict[ENV_PYTHON] = envPython
+            replaceDict[ENV_CHANGES] = envChanges
+        except (subprocess.CalledProcessError, OSError, ValueError) as e:
+            print("Could not capture the environment (%s), the launcher will "
+                  "activate it at every launch." % e)
 
     # Replace values
     content = content % replaceDict
@@ -254,6 +927,51 @@ def createLauncher(scipionHome, conda, dry, scipionEnv, devel=False):
     return launcherFn
 
 
+def captureEnvironment(activationCmd):
+    """ Activate the environment and return its python and the list of
+    changes (name, action, value) its activation makes to the current
+    environment variables. Actions are set, prepend (value goes before the
+    current one), paths (the [added, removed] entries of a list of folders,
+    e.g. PATH: the rest are taken from the environment at launch time) and
+    unset. """
+
+    script = ('import json, os, sys; '
+              'print("%s" + json.dumps([sys.executable, dict(os.environ)]))' % ENV_MARKER)
+    output = subprocess.check_output("%s && python -c '%s'" % (activationCmd, script),
+                                     shell=True)
+    if not isinstance(output, str):
+        output = output.decode()
+    lines = [line for line in output.splitlines() if line.startswith(ENV_MARKER)]
+    if not lines:
+        raise ValueError("environment not printed")
+    envPython, environ = json.loads(lines[-1][len(ENV_MARKER):])
+
+    changes = []
+    for name in sorted(environ):
+        value = environ[name]
+        current = os.environ.get(name, None)
+        if name in VOLATILE_VARS or value == current:
+            continue
+        if name.endswith(PATH_VARS_SUFFIXES):
+            # Not the whole value: e.g. conda activate replaces base/bin
+            # in PATH, and modules loaded later must be kept
+            entries = value.split(os.pathsep)
+            currentEntries = (current or "").split(os.pathsep)
+            added = [entry for entry in entries if entry and entry not in currentEntries]
+            removed = [entry for entry in currentEntries if entry and entry not in entries]
+            if added or removed:
+                changes.append((name, "paths", [added, removed]))
+        elif current and value.endswith(current):
+            changes.append((name, "prepend", value[:-len(current)]))
+        else:
+            changes.append((name, "set", value))
+    for name in sorted(os.environ):
+        if name not in environ and name not in VOLATILE_VARS:
+            changes.append((name, "unset", None))
+
+    return envPython, changes
+
+
 def writeFile(file, content, dry):
     if dry:
         print("%s would've been created with the following content:" % file)
@@ -266,13 +984,14 @@ def writeFile(file, content, dry):
         fh.close()
 
 
-def createConfigFile(scipionHome, scratchPath, dry):
+def createConfigFile(scipionHome, scratchPath, dry, solver=CONDA, condaInit=None):
     """
     Create a minimun config file with CONDA_ACTIVATION_CMD and SCIPION_SCRATCH
     variables
     """
     lines = ''
-    condaInit = getCondaInitCmd(False)
+    if condaInit is None:
+        condaInit = getCondaInitCmd(False, solver)
     if condaInit:
         lines = CONDA_ACTIVATION_CMD + ' = ' + condaInit + os.linesep
     if scratchPath is not None:
@@ -285,127 +1004,483 @@ def createConfigFile(scipionHome, scratchPath, dry):
         writeFile(os.path.join(configPath, configFileName), lines, dry)
 
 
-def main():
+def getParser():
+    """ Parser of the installer options """
+    parser = argparse.ArgumentParser(prog=INSTALL_ENTRY,
+                                     description= "Installs scipion3 in a conda or virtualenv environment.\n"
+                                                  "Check all parameters bellow for a custom installation. If there are issues initializing "
+                                                  " conda you can set %s variable and it will be used instead of guessing.\n "
+                                                  "Typical values are . \"/path/to/miniconda3/etc/profile.d/conda.sh\" or "
+                                                  "eval \"$(/path/to/miniconda3/bin/conda shell.bash hook)\"" % CONDA_ACTIVATION_CMD,
+                                     epilog="Happy Scipioning!")
+    parser.add_argument('path', nargs='?',
+                        help='Location where you want scipion to be installed.')
+    parser.add_argument('-conda',
+                        help='Force conda as environment manager, otherwise will use conda anyway if '
+                             'found in the path, else: virtualenv.',
+                        action='store_true')
+    parser.add_argument(VENV_ARG,
+                        help='Force virtualenv as environment manager, otherwise will use conda if '
+                             'found in the path, otherwise: virtualenv.',
+                        action='store_true')
+
+    parser.add_argument('-solver', help='Conda compatible program creating the '
+                                        'environment when conda is used. By '
+                                        'default the fastest one found: %s.'
+                                        % ", ".join(CONDA_SOLVERS),
+                        choices=CONDA_SOLVERS, default=None)
+
+    parser.add_argument('-venvTool', help='Program creating the environment '
+                                          'and installing packages when '
+                                          'virtualenv is used. By default uv '
+                                          'if found (but with -offline), '
+                                          'otherwise virtualenv.',
+                        choices=[UV, VIRTUALENV], default=None)
+
+    parser.add_argument('-launcher', help='Only (re)generates the launcher of an '
+                                          'existing installation, capturing its '
+                                          'environment again. Use it after '
+                                          'changing the environment.',
+                        action='store_true')
+
+    parser.add_argument('-exportBundle', help='Packs the installation at path '
+                                              '(and its conda environment) into '
+                                              'this archive, to be unpacked '
+                                              'elsewhere with -importBundle. Pass '
+                                              'the environment options used to '
+                                              'install it.',
+                        default=None)
+    parser.add_argument('-importBundle', help='Instead of installing, unpacks '
+                                              'an archive made with -exportBundle '
+                                              'into path, rewriting its paths, and '
+                                              'creates the launcher and config '
+                                              'file.',
+                        default=None)
+
+    parser.add_argument('-site', help='Installs a site installation shared, '
+                                      'read only, by several users: each one '
+                                      'creates an overlay of it with -base.',
+                        action='store_true')
+    parser.add_argument('-base', help='Instead of installing, creates at path '
+                                      'a user overlay of this site installation '
+                                      '(made with -site): an environment seeing '
+                                      'its packages, a link to its software '
+                                      'folder, a config file and a launcher.',
+                        default=None)
+
+    parser.add_argument('-manifest', help='Instead of path, json file with '
+                                          'several installations (targets) to '
+                                          'install at the same time, sharing the '
+                                          'package cache, git mirrors and CPUs. '
+                                          'Other options go in the manifest, but '
+                                          '-dry. See scipioninstaller/fleet.py.',
+                        default=None)
+
+    parser.add_argument('-dev', help='installs components in devel mode',
+                        action='store_true')
+    parser.add_argument('-noXmipp', help='Xmipp is installed in devel mode '
+                                         'under xmipp-bundle dir by default. '
+                                         'This flag skips the Xmipp installation.',
+                        action='store_true')
+    parser.add_argument('-j', help='Number of processors, Xmipp may take a while... '
+                                   'By default, as many as usable CPUs (affinity, '
+                                   'cgroups, Slurm) and available memory allow.',
+                        type=int, default=None)
+    parser.add_argument('-pycInvalidation', help='How python checks that the '
+                                                 'bytecode compiled during the '
+                                                 'installation is up to date. '
+                                                 'unchecked-hash avoids checking '
+                                                 'the sources, for read only '
+                                                 'installations (editable '
+                                                 'repositories are still checked). '
+                                                 'By default %s, %s with -site.'
+                                                 % (PYC_INVALIDATION_MODES[0],
+                                                    PYC_INVALIDATION_MODES[2]),
+                        choices=PYC_INVALIDATION_MODES, default=None)
+    parser.add_argument('-plugins', help='Plugins to install: name, '
+                                         'name==version, name@branch (from its '
+                                         'git repository) or a file with one per '
+                                         'line. Can be repeated. They are '
+                                         'installed by the same pip call as '
+                                         'scipion and their binaries are built '
+                                         'at the same time, sharing the -j CPUs.',
+                        action='append', default=[])
+    parser.add_argument('-dry', help='Just shows the installation steps, '
+                                     'their parallel waves and the commands '
+                                     'without running them.',
+                        action='store_true')
+    parser.add_argument('-workers', help='Number of independent installation '
+                                         'steps (clones, environment, builds...) '
+                                         'run in parallel.',
+                        type=int, default=DEFAULT_WORKERS)
+    
+    parser.add_argument('-httpsClone', help='Only when -dev is active, '
+                                            'makes git clones using https '
+                                            'instead of ssh',
+                        action='store_true')
+
+    parser.add_argument('-cloneDepth', help='Only when -dev is active, '
+                                            'makes shallow clones with this '
+                                            'number of commits. Pulls keep them '
+                                            'shallow.',
+                        type=int, default=None)
+    parser.add_argument('-singleBranch', help='Only when -dev is active, '
+                                              'clones only the history of '
+                                              'the requested branch.',
+                        action='store_true')
+    parser.add_argument('-blobless', help='Only when -dev is active, makes '
+                                          'partial clones (--filter=blob:none): '
+                                          'file contents of old commits are '
+                                          'downloaded on demand.',
+                        action='store_true')
+    parser.add_argument('-unshallow', help='Only when -dev is active, fetches '
+                                           'the full history of existing '
+                                           'shallow or single branch clones.',
+                        action='store_true')
+
+    parser.add_argument('-gitMirror', help='Only when -dev is active, folder '
+                                           'with bare mirrors of the repositories '
+                                           'shared by several installations: they '
+                                           'are updated and used as reference for '
+                                           'the clones. Defaults to %s variable.'
+                                           % SCIPION_GIT_MIRROR,
+                        default=os.environ.get(SCIPION_GIT_MIRROR, None))
+
+    parser.add_argument('-buildWheelhouse', help='Instead of installing, '
+                                                 'downloads into this folder all the '
+                                                 'packages this installation needs, '
+                                                 'with a manifest of their versions '
+                                                 'and hashes, to be used later with '
+                                                 '-wheelhouse.',
+                        default=None)
+    parser.add_argument('-wheelhouse', help='Installs python packages only from '
+                                            'this folder (made with -buildWheelhouse), '
+                                            'without accessing any package index.',
+                        default=None)
+    parser.add_argument('-offline', help='Installs without network access: '
+                                         'requires -wheelhouse and conda creates '
+                                         'the environment from its package cache. '
+                                         'Xmipp sources or binaries are still '
+                                         'downloaded unless -noXmipp is passed.',
+                        action='store_true')
+
+    parser.add_argument('-update', help='Only when -dev is active, pulls the '
+                                        'repositories of an existing installation '
+                                        'and only installs again (pip) or rebuilds '
+                                        '(Xmipp) the ones whose commit or '
+                                        'dependencies changed since the last run.',
+                        action='store_true')
+    parser.add_argument('-force', help='Runs every installation step, ignoring '
+                                       'the ones recorded as done by a '
+                                       'previous run in %s.' % JOURNAL_NAME,
+                        action='store_true')
+
+    parser.add_argument('-ccache', help='Only when -dev is active, compiles Xmipp '
+                                        'through ccache using this cache folder, '
+                                        'that can be shared by several '
+                                        'installations. Defaults to %s variable.'
+                                        % SCIPION_CCACHE_DIR,
+                        default=os.environ.get(SCIPION_CCACHE_DIR, None))
+    parser.add_argument('-xmippCache', help='Only when -dev is active, folder '
+                                            'caching the Xmipp builds: a build of '
+                                            'the same commits, compiler and '
+                                            'configuration is restored from it '
+                                            'instead of compiling. Defaults to %s '
+                                            'variable.' % SCIPION_XMIPP_CACHE,
+                        default=os.environ.get(SCIPION_XMIPP_CACHE, None))
+
+    parser.add_argument('-packageCache', help='Folder where pip, uv and conda '
+                                              'keep the packages they download, '
+                                              'shared by several installations. '
+                                              'Defaults to %s variable.'
+                                              % SCIPION_PACKAGE_CACHE,
+                        default=os.environ.get(SCIPION_PACKAGE_CACHE, None))
+    parser.add_argument('-dedup', help='Replaces the files of the environment '
+                                       'and software folder identical to ones of '
+                                       'other installations by reflinks to a '
+                                       'single copy kept in the -packageCache '
+                                       'folder. Without reflink support, only '
+                                       'the environment files are hardlinked, '
+                                       'made read only.',
+                        action='store_true')
+
+    parser.add_argument('-noAsk',
+                        help='try to install scipion ignoring some '
+                             'control questions in that process. You must '
+                             'make sure to write the correct path where '
+                             'Scipion will be installed',
+                        action='store_true')
+    parser.add_argument('-n', help='Name of the virtual environment. '
+                                         'By default, if this parameter is '
+                                         'not passed, the name will be '
+                                         + SCIPION_ENV,
+                        default=SCIPION_ENV)
+
+    parser.add_argument('-sciBranch', help='Name of the branch of scipion repos to clone when -dev is passed.',
+                        default=SCIPION_DEFAULT_BRANCH)
+
+    parser.add_argument('-xmippBranch', help='Name of the branch of xmipp repos to clone when -dev is passed.',
+                        default=XMIPP_DEFAULT_BRANCH)
+
+    parser.add_argument('-scratchPath',
+                        help='Path to a folder working at high '
+                             'speed(like SSDs) to be used temporarily '
+                             'during processing.',
+                        default=None)
+    parser.add_argument('-probeScratch', help='Measures the sequential and '
+                                              'random read/write speed of the '
+                                              '-scratchCandidate folders (by default '
+                                              '-scratchPath, $TMPDIR and usual scratch '
+                                              'mounts like /scratch or /tmp) and uses '
+                                              'the fastest writable one, not in memory '
+                                              '(tmpfs), as scratch path.',
+                        action='store_true')
+    parser.add_argument('-scratchCandidate', help='Folder probed by -probeScratch. '
+                                                  'Can be repeated.',
+                        action='append', default=None)
+
+    return parser
+
+
+def getArgs(path, **options):
+    """ Options of an installation at path, for using the installer from
+    python: the defaults of the command line options updated with options,
+    named like them without the dash (e.g. noXmipp=True, plugins=[...]).
+    They are parsed as the command line ones. """
+    parser = getParser()
+    actions = dict((action.dest, action) for action in parser._actions
+                   if action.option_strings)
+    argv = [path]
+    for name, value in sorted(options.items()):
+        action = actions.get(name)
+        if action is None or name in ("help", "manifest"):
+            raise InstallationError("Unknown installation option %s." % name)
+        if value is None:
+            continue
+        flag = action.option_strings[0]
+        if action.nargs == 0:
+            if not isinstance(value, bool):
+                raise InstallationError("Option %s is a flag: true or false, not %r."
+                                        % (name, value))
+            if value:
+                argv.append(flag)
+            continue
+        values = value if isinstance(value, list) else [value]
+        if len(values) > 1 and not isinstance(action, argparse._AppendAction):
+            raise InstallationError("Option %s takes a single value, not %r."
+                                    % (name, value))
+        # flag=value: values may start with a dash
+        argv.extend("%s=%s" % (flag, item) for item in values)
     try:
-        # Arg parser configuration
-        parser = argparse.ArgumentParser(prog=INSTALL_ENTRY,
-                                         description= "Installs scipion3 in a conda or virtualenv environment.\n"
-                                                      "Check all parameters bellow for a custom installation. If there are issues initializing "
-                                                      " conda you can set %s variable and it will be used instead of guessing.\n "
-                                                      "Typical values are . \"/path/to/miniconda3/etc/profile.d/conda.sh\" or "
-                                                      "eval \"$(/path/to/miniconda3/bin/conda shell.bash hook)\"" % CONDA_ACTIVATION_CMD,
-                                         epilog="Happy Scipioning!")
-        parser.add_argument('path',
-                            help='Location where you want scipion to be installed.')
-        parser.add_argument('-conda',
-                            help='Force conda as environment manager, otherwise will use conda anyway if '
-                                 'found in the path, else: virtualenv.',
-                            action='store_true')
-        parser.add_argument(VENV_ARG,
-                            help='Force virtualenv as environment manager, otherwise will use conda if '
-                                 'found in the path, otherwise: virtualenv.',
-                            action='store_true')
-
-        parser.add_argument('-dev', help='installs components in devel mode',
-                            action='store_true')
-        parser.add_argument('-noXmipp', help='Xmipp is installed in devel mode '
-                                             'under xmipp-bundle dir by default. '
-                                             'This flag skips the Xmipp installation.',
-                            action='store_true')
-        parser.add_argument('-j', help='Number of processors, Xmipp may take a while...',
-                            default=8)
-        parser.add_argument('-dry', help='Just shows the commands without running them.',
-                            action='store_true')
-        
-        parser.add_argument('-httpsClone', help='Only when -dev is active, '
-                                                'makes git clones using https '
-                                                'instead of ssh',
-                            action='store_true')
-
-        parser.add_argument('-noAsk',
-                            help='try to install scipion ignoring some '
-                                 'control questions in that process. You must '
-                                 'make sure to write the correct path where '
-                                 'Scipion will be installed',
-                            action='store_true')
-        parser.add_argument('-n', help='Name of the virtual environment. '
-                                             'By default, if this parameter is '
-                                             'not passed, the name will be '
-                                             + SCIPION_ENV,
-                            default=SCIPION_ENV)
-
-        parser.add_argument('-sciBranch', help='Name of the branch of scipion repos to clone when -dev is passed.',
-                            default=SCIPION_DEFAULT_BRANCH)
-
-        parser.add_argument('-xmippBranch', help='Name of the branch of xmipp repos to clone when -dev is passed.',
-                            default=XMIPP_DEFAULT_BRANCH)
-
-        parser.add_argument('-scratchPath',
-                            help='Path to a folder working at high '
-                                 'speed(like SSDs) to be used temporarily '
-                                 'during processing.',
-                            default=None)
-
-        # Parse and fill args
-        args = parser.parse_args()
-        scipionHome = os.path.abspath(args.path)
-
-        # Decide on environment manager
-        if args.conda:
-            conda = args.conda
-        elif args.venv:
+        return parser.parse_args(argv)
+    except SystemExit:  # argparse has printed why
+        raise InstallationError("Wrong installation options: %s" % " ".join(argv[1:]))
+
+
+def install(args):
+    """ Install scipion, or do what the options ask for instead (launcher,
+    bundles, overlay, wheelhouse), as described by args (see getArgs).
+    Return the launcher (where it would be in dry mode), None if there is
+    none (bundle export, wheelhouse). Raise InstallationError if it fails. """
+    scipionHome = os.path.abspath(args.path)
+
+    bundleMetadata = None
+    if args.importBundle:
+        # The environment manager, name and mode are the bundle ones
+        args.importBundle = os.path.abspath(args.importBundle)
+        bundleMetadata = bundle.readMetadata(args.importBundle)
+        args.conda = bundleMetadata["conda"]
+        args.venv = not args.conda
+        args.n = bundleMetadata["scipionEnv"]
+        args.dev = bundleMetadata["devel"]
+
+    if args.base:
+        # Environment manager and mode are the site ones
+        args.base = os.path.abspath(args.base)
+        scipionEnv = '.' + args.n if args.n == SCIPION_ENV else args.n
+        if args.probeScratch:
+            args.scratchPath = chooseScratch(args.scratchCandidate, args.scratchPath,
+                                             args.dry)
+        solveFolder(scipionHome, args.dry)
+        return createOverlay(scipionHome, scipionEnv, args.dry, args)
+
+    # Decide on environment manager
+    if args.conda or args.solver:
+        conda = True
+    elif args.venv or args.venvTool:
+        conda = False
+    else: # decide, favouring conda
+        # If conda (or mamba, micromamba) is detected
+        solver = guessCondaSolver()
+        if solver:
+            print("%s detected. Favouring it. If you want a virtualenv installation "
+                  "cancel installation and pass %s ." % (solver, VENV_ARG))
+            conda = True
+        else:
+            # Fall back to virtualenv
             conda = False
-        else: # decide, favouring conda
-            # If conda is detected
-            if checkProgram(CONDA, doRaise=False):
-                print("%s detected. Favouring it. If you want a virtualenv installation "
-                      "cancel installation and pass %s ." % (CONDA, VENV_ARG))
-                conda = True
-            else:
-                # Fall back to virtualenv
-                conda = False
-
-        noAsk = args.noAsk
-        dev = args.dev
-        dry = args.dry
-        scratchPath = args.scratchPath
-
-        # Creating the Scratch Folder
-        if scratchPath is not None:
-            solveFolder(scratchPath, dry)
-
-        checkProgram(GIT) if dev else None
-        # Check Scipion home folder and create it if apply.
-        solveFolder(scipionHome, dry)
-        scipionEnv = args.n
-        if not conda and scipionEnv == SCIPION_ENV:
-            scipionEnv = '.' + scipionEnv
-
-        cmd = getEnvironmentCmd(conda, scipionHome, scipionEnv, noAsk)
-        # Creating Scipion installation command and the launcher
-        cmd += getScipionInstallationCmd(scipionHome, dev, args)
-        # Flush stdout
-        sys.stdout.flush()
-        runCmd(cmd, dry)
-        launcher = createLauncher(scipionHome, conda, dry, scipionEnv, dev)
-        print("------------------------------------")
-        print("Scipion core successfully installed.")
-        print("------------------------------------")
-        # Creating Xmipp installation command
-        if not args.noXmipp:
-            cmd = getEnvironmentCmd(conda, scipionHome, scipionEnv, noAsk, create=False)
-            cmd += getXmippInstallationCmd(scipionHome, dev, args)
-            sys.stdout.flush()
-            runCmd(cmd, dry)
-
-        # Creating a minimum Scipion config file
-        createConfigFile(scipionHome, scratchPath, dry)
 
+    if conda:
+        args.solver = args.solver or guessCondaSolver() or CONDA
+        checkProgram(args.solver)
+    else:
+        # uv venv --seed downloads pip, virtualenv has it embedded
+        if args.offline and args.venvTool == UV:
+            raise InstallationError("-offline can not use uv: it downloads pip to "
+                                    "create the environment. Use -venvTool %s."
+                                    % VIRTUALENV)
+        if args.venvTool is None:
+            args.venvTool = (UV if not args.offline and checkProgram(UV, doRaise=False)
+                             else VIRTUALENV)
+        if args.venvTool == UV:
+            checkProgram(UV)
+
+    if args.j is None:
+        args.j, reason = resources.guessJobs()
+        if not args.noXmipp or args.plugins:
+            print("Building with -j %s: %s." % (args.j, reason))
+
+    if args.pycInvalidation is None:
+        # Nobody edits a site installation but its administrator
+        args.pycInvalidation = PYC_INVALIDATION_MODES[2 if args.site else 0]
+
+    args.pluginList = plugins.readPlugins(args.plugins)
+    if not args.noXmipp and any(plugin["name"] == XMIPP_PLUGIN
+                                for plugin in args.pluginList):
+        print("%s is installed with Xmipp (unless -noXmipp), it is ignored "
+              "in -plugins." % XMIPP_PLUGIN)
+        args.pluginList = [plugin for plugin in args.pluginList
+                           if plugin["name"] != XMIPP_PLUGIN]
+
+    noAsk = args.noAsk
+    dev = args.dev
+    dry = args.dry
+    if args.probeScratch:
+        args.scratchPath = chooseScratch(args.scratchCandidate, args.scratchPath, dry)
+    scratchPath = args.scratchPath
+
+    # Creating the Scratch Folder
+    if scratchPath is not None:
+        solveFolder(scratchPath, dry)
+
+    checkProgram(GIT) if dev else None
+    if dev and args.gitMirror:
+        args.gitMirror = os.path.abspath(args.gitMirror)
+        solveFolder(args.gitMirror, dry)
+    if dev and args.ccache:
+        args.ccache = os.path.abspath(args.ccache)
+        ccachePath = checkProgram(CCACHE)
         if not dry:
-            header = "Installation successfully finished!! Happy EM processing!!"
-            content = "You can launch Scipion using the launcher at: %s " % launcher
-            createMessageInstallation(header, [content])
-
+            buildcache.setupCcache(args.ccache, ccachePath)
+    if dev and args.xmippCache:
+        args.xmippCache = os.path.abspath(args.xmippCache)
+        solveFolder(args.xmippCache, dry)
+    if args.dedup and not args.packageCache:
+        raise InstallationError("-dedup needs a -packageCache folder.")
+    if args.packageCache:
+        args.packageCache = os.path.abspath(args.packageCache)
+        solveFolder(args.packageCache, dry)
+        # Also for the environment creation, that does not use envCmd
+        for var, value in dedup.getCacheVars(args.packageCache):
+            os.environ[var] = value
+    # Check Scipion home folder and create it if apply.
+    solveFolder(scipionHome, dry)
+    scipionEnv = args.n
+    if not conda and scipionEnv == SCIPION_ENV:
+        scipionEnv = '.' + scipionEnv
+
+    envCmd = getEnvironmentCmd(conda, scipionHome, scipionEnv, noAsk,
+                               create=False, solver=args.solver,
+                               venvTool=args.venvTool)
+    envCmd += cmdfy("export SCIPION_HOME=%s" % scipionHome)
+
+    if args.launcher:
+        launcher = createLauncher(scipionHome, conda, dry, scipionEnv, args.solver)
+        if not dry:
+            createMessageInstallation("Launcher successfully created!!",
+                                      ["Launcher at: %s" % launcher])
+        return launcher
+
+    if args.exportBundle:
+        args.exportBundle = os.path.abspath(args.exportBundle)
+        exportBundle(scipionHome, conda, dry, scipionEnv, dev, args)
+        return
+
+    if args.importBundle:
+        return importBundle(scipionHome, conda, dry, scipionEnv, bundleMetadata, args)
+
+    journal = None
+    logDir = None
+    if os.path.exists(scipionHome):
+        journal = Journal(os.path.join(scipionHome, JOURNAL_NAME), args.force)
+        if not dry:
+            logDir = os.path.join(scipionHome, LOGS_NAME)
+            solveFolder(logDir, dry)
+    # Non interactive installs (e.g. in clusters) only print the step
+    # progress, their output is in the logs
+    echo = not noAsk
+
+    if args.buildWheelhouse:
+        args.buildWheelhouse = os.path.abspath(args.buildWheelhouse)
+        solveFolder(args.buildWheelhouse, dry)
+        graph = getWheelhouseGraph(scipionHome, conda, scipionEnv, dev, args, dry)
+        sys.stdout.flush()
+        runInstallationGraph(graph, scipionHome, envCmd, args.workers, dry,
+                             journal, logDir=logDir, echo=echo)
+        if not dry:
+            createMessageInstallation("Wheelhouse successfully created!!",
+                                      ["Install from it passing: -wheelhouse %s"
+                                       % args.buildWheelhouse])
+        return
+
+    if args.offline and not args.wheelhouse:
+        raise InstallationError("-offline needs a -wheelhouse folder.")
+    if args.wheelhouse:
+        args.wheelhouse = os.path.abspath(args.wheelhouse)
+        if not dry:
+            wheelhouse.checkWheelhouse(args.wheelhouse)
+        for var, value in wheelhouse.getPipOfflineVars(args.wheelhouse):
+            envCmd += cmdfy("export %s=%s" % (var, value))
+
+    graph = getInstallationGraph(scipionHome, conda, scipionEnv, dev,
+                                 args, dry)
+    tracer = None if dry else Tracer(scipionHome)
+    # Flush stdout
+    sys.stdout.flush()
+    try:
+        runInstallationGraph(graph, scipionHome, envCmd, args.workers, dry,
+                             journal, tracer, logDir, echo, args.j)
+    finally:
+        if tracer is not None:
+            reportTrace(tracer, os.path.join(scipionHome, TRACE_NAME))
+    launcher = os.path.join(scipionHome, LAUNCHER_NAME)
+
+    if not dry:
+        header = "Installation successfully finished!! Happy EM processing!!"
+        content = "You can launch Scipion using the launcher at: %s " % launcher
+        createMessageInstallation(header, [content])
+    return launcher
+
+
+def main(argv=None):
+    parser = getParser()
+    args = parser.parse_args(argv)
+    if args.path is None and args.manifest is None:
+        parser.error("the path or a -manifest is required")
+    if args.manifest:
+        defaults = vars(parser.parse_args([]))
+        given = sorted(name for name, value in vars(args).items()
+                       if name not in ("manifest", "dry") and value != defaults[name])
+        if given:
+            parser.error("-manifest only admits -dry, put %s in the manifest"
+                         % ", ".join(given))
+    try:
+        if args.manifest:
+            results = installFleet(args.manifest, args.dry)
+            if any(result["status"] != fleet.OK for result in results):
+                sys.exit(-1)
+        else:
+            install(args)
     except InstallationError as e:
         header = "Installation failed"
         content = []
@@ -425,6 +1500,188 @@ def main():
         sys.exit(-1)
 
 
+def installFleet(manifestFn, dry=False):
+    """ Install the targets of manifestFn (see fleet), sharing the package
+    cache, the git mirrors and the CPUs. Return their results. """
+    parallel, cacheDir, targets = fleet.readManifest(manifestFn)
+    parallel = min(parallel, len(targets))
+    jobs, reason = resources.guessJobs()
+    shared = {"packageCache": os.path.join(cacheDir, "packages"),
+              "gitMirror": os.path.join(cacheDir, "git"),
+              "j": max(1, jobs // parallel)}
+    targetArgs = {}
+    for name, options in targets:
+        options = dict(options)
+        args = getArgs(options.pop("path"), **options)
+        # Nobody answers: questions and step outputs go to the logs
+        args.noAsk = True
+        args.dry = args.dry or dry
+        for option, value in shared.items():
+            if getattr(args, option) is None:
+                setattr(args, option, value)
+        targetArgs[name] = args
+    # Its variables are set in the environment of the process
+    packageCaches = set(args.packageCache for args in targetArgs.values())
+    if len(packageCaches) > 1:
+        raise InstallationError("The targets of a manifest share a single package "
+                                "cache, they have: %s" % ", ".join(sorted(packageCaches)))
+
+    print("Installing %s targets, %s at a time, sharing %s CPUs (%s)."
+          % (len(targets), parallel, jobs, reason))
+    sys.stdout.flush()
+    manifestBase = os.path.splitext(os.path.abspath(manifestFn))[0]
+    results = fleet.runTargets(targets, parallel,
+                               lambda name, options: install(targetArgs[name]),
+                               manifestBase + "-logs")
+    resultsFn = manifestBase + "-results.json"
+    with open(resultsFn, "w") as fh:
+        json.dump(results, fh, indent=1)
+    content = fleet.getReport(results)
+    content.append(" ")
+    content.append("Results: %s" % resultsFn)
+    createMessageInstallation("Fleet installation", content)
+    return results
+
+
+def chooseScratch(candidates, scratchPath, dry):
+    """ Probe the candidate scratch folders and return the fastest one,
+    scratchPath if none can be used """
+    if not candidates:
+        candidates = ([scratchPath] if scratchPath else []) + scratch.getDefaultCandidates()
+    if dry:
+        print("These scratch folders would have been probed: %s" % ", ".join(candidates))
+        return scratchPath
+    print("Probing scratch folders (%s MB each)..." % (scratch.PROBE_SIZE // scratch.MB))
+    results, best = scratch.probeCandidates(candidates)
+    content = scratch.getReport(results)
+    content.append(" ")
+    if best is None:
+        content.append("No usable scratch folder found among: %s" % ", ".join(candidates))
+        best = scratchPath
+    else:
+        content.append("%s = %s will be written in the config file" % (SCIPION_SCRATCH, best))
+    createMessageInstallation("Scratch folders", content)
+    return best
+
+
+def getEnvPrefix(scipionHome, conda, scipionEnv, solver=CONDA):
+    """ Folder of the environment: inside scipionHome for virtualenv, asked
+    to the activated environment for conda """
+    if not conda:
+        return os.path.join(scipionHome, scipionEnv)
+    activationCmd = (getCondaInitCmd(solver=solver) + " && "
+                     + getCondaenvActivationCmd(scipionEnv, solver))
+    try:
+        envPython = captureEnvironment(activationCmd)[0]
+    except (subprocess.CalledProcessError, OSError, ValueError) as e:
+        raise InstallationError("Environment %s could not be activated: %s"
+                                % (scipionEnv, e))
+    return os.path.dirname(os.path.dirname(envPython))
+
+
+def exportBundle(scipionHome, conda, dry, scipionEnv, devel, args):
+    """ Pack the installation at scipionHome into args.exportBundle """
+    launcher = os.path.join(scipionHome, LAUNCHER_NAME)
+    if not dry and not os.path.exists(launcher):
+        raise InstallationError("%s not found: %s is not a finished installation."
+                                % (launcher, scipionHome))
+    envPrefix = getEnvPrefix(scipionHome, conda, scipionEnv, args.solver)
+    if dry:
+        print("%s and %s would have been packed into %s"
+              % (scipionHome, envPrefix, args.exportBundle))
+        return
+    metadata = {"conda": conda, "scipionEnv": scipionEnv, "devel": devel}
+    metadata = bundle.exportBundle(scipionHome, args.exportBundle, metadata,
+                                   envPrefix, exclude=[LOGS_NAME, TRACE_NAME])
+    createMessageInstallation("Bundle successfully created!!",
+                              ["Bundle at: %s" % args.exportBundle,
+                               "%s files will be relocated." % len(metadata["files"]),
+                               "Unpack it passing: -importBundle %s" % args.exportBundle])
+
+
+def importBundle(scipionHome, conda, dry, scipionEnv, metadata, args):
+    """ Unpack args.importBundle into scipionHome and create its launcher
+    and config file """
+    envPrefix = None
+    if conda and bundle.ENV_FOLDER in metadata["prefixes"]:
+        # The environment goes inside SCIPION_HOME, activated by its path
+        envPrefix = os.path.join(scipionHome, "." + os.path.basename(scipionEnv))
+        scipionEnv = envPrefix
+    if dry:
+        print("%s would have been unpacked into %s" % (args.importBundle, scipionHome))
+    else:
+        start = time.time()
+        bundle.importBundle(args.importBundle, scipionHome, envPrefix)
+        print("Bundle unpacked in %.1fs" % (time.time() - start))
+    launcher = createLauncher(scipionHome, conda, dry, scipionEnv, args.solver)
+    createConfigFile(scipionHome, args.scratchPath, dry, args.solver)
+    if not dry:
+        content = ["You can launch Scipion using the launcher at: %s " % launcher]
+        if envPrefix is not None:
+            content.append("Its environment is %s (-n %s to regenerate the launcher)"
+                           % (envPrefix, envPrefix))
+        createMessageInstallation("Bundle successfully installed!! Happy EM processing!!",
+                                  content)
+    return launcher
+
+
+def createOverlay(scipionHome, scipionEnv, dry, args):
+    """ Create at scipionHome a user overlay of the site installation at
+    args.base: an environment seeing the site packages, a link to the site
+    software folder, a config file and a launcher """
+    siteHome = args.base
+    metadata = overlay.readSiteMetadata(siteHome)
+    if scipionHome == siteHome:
+        raise InstallationError("The overlay can not be created in the site "
+                                "installation %s itself." % siteHome)
+    start = time.time()
+    envPrefix = os.path.join(scipionHome, scipionEnv)
+    if dry:
+        print("%s would have been created, seeing the packages of %s."
+              % (envPrefix, metadata["envPrefix"]))
+        print("%s would have been linked into %s." % (
+            os.path.join(siteHome, overlay.SOFTWARE_FOLDER), scipionHome))
+    else:
+        try:
+            overlay.createOverlayEnv(envPrefix, metadata["envPython"],
+                                     metadata["siteDirs"])
+        except (subprocess.CalledProcessError, OSError) as e:
+            raise InstallationError("Environment %s could not be created: %s"
+                                    % (envPrefix, e))
+        overlay.linkSoftware(siteHome, scipionHome)
+
+    # The venv activation would undo the one of a site virtualenv: only
+    # its programs are needed
+    if metadata["conda"]:
+        siteActivation = metadata["activation"]
+    else:
+        siteActivation = 'export PATH="%s:$PATH"' % os.path.join(metadata["envPrefix"], "bin")
+    createConfigFile(scipionHome, args.scratchPath, dry, condaInit=metadata["condaInit"])
+    launcher = createLauncher(scipionHome, False, dry, scipionEnv,
+                              activationCmd=siteActivation + " && " +
+                              getVirtualenvActivationCmd(scipionHome, scipionEnv))
+    if not dry:
+        size = getFolderSize(scipionHome) / 1024.0 ** 2
+        createMessageInstallation("Overlay successfully created!! Happy EM processing!!",
+                                  ["You can launch Scipion using the launcher at: %s " % launcher,
+                                   "Packages and binaries come from %s" % siteHome,
+                                   "Overlay created in %.1fs, %.1f MB" % (time.time() - start, size)])
+    return launcher
+
+
+def reportTrace(tracer, traceFn):
+    """ Save the trace of the installation steps and print their summary """
+    try:
+        tracer.save(traceFn)
+    except (IOError, OSError) as e:
+        print("Installation trace could not be written in %s: %s" % (traceFn, e))
+    else:
+        content = tracer.getSummary()
+        content.append(" ")
+        content.append("Trace (chrome://tracing or https://ui.perfetto.dev): %s" % traceFn)
+        createMessageInstallation("Installation steps", content)
+
+
 def createMessageInstallation(header="", content=[]):
     """
     Create a table related with Scipion installation
@@ -452,7 +1709,9 @@ def createMessageInstallation(header="", content=[]):
     print(botomTable)
 
 
-def runCmd(cmd, dry):
+def runCmd(cmd, dry, stepName=None, log=None):
+    """ Run cmd in a shell and return the resources it used (see waitProcess).
+    With a StepLog, its output goes to it. Raise InstallationError if it fails. """
     # remove last CMD_SEP
     if cmd.endswith(CMD_SEP):
         cmd = cmd[:-len(CMD_SEP)]
@@ -460,9 +1719,19 @@ def runCmd(cmd, dry):
     if dry:
         print(cmd)
     else:
-        val = os.system(cmd)
+        if log is not None:
+            val, usage = log.run(cmd)
+            if val != 0:
+                raise InstallationError(log.getFailure(val))
+            return usage
+        process = subprocess.Popen(cmd, shell=True)
+        val, usage = waitProcess(process)
         if val != 0:
+            if stepName is not None:
+                raise InstallationError("Something went wrong (SEE ERRORS ABOVE) in step %s when running: \n\n %s"
+                                        % (stepName, cmd))
             raise InstallationError("Something went wrong (SEE ERRORS ABOVE) when running: \n\n %s" % cmd)
+        return usage
 
 
 if __name__ == '__main__':
@@ -1,7 +1,66 @@
+
 PYTHON_PROGRAM = "PYTHON_PROGRAM"
 VIRTUAL_ENV_VAR = "VIRTUAL_ENV_VAR"
 ACTIVATE_ENV_CMD = "ACTIVATE_ENV_CMD"
-LAUNCHER_TEMPLATE='''#!/usr/bin/env %(PYTHON_PROGRAM)s 
+ENV_PYTHON = "ENV_PYTHON"
+ENV_CHANGES = "ENV_CHANGES"
+
+# scipion3 git [options]: runs git in all the repositories under SCIPION_HOME
+# in parallel, printing their outputs in order.
+GIT_CODE = '''
+def findGitRepos(folder, depth=3):
+    """ git repositories under folder (also nested ones, like the xmipp
+    sources inside xmipp-bundle), skipping hidden folders and binaries """
+    repos = []
+    for name in sorted(os.listdir(folder)):
+        path = join(folder, name)
+        if name.startswith(".") or name == "software" or not os.path.isdir(path):
+            continue
+        if os.path.exists(join(path, ".git")):
+            repos.append(path)
+        if depth > 1:
+            repos.extend(findGitRepos(path, depth - 1))
+    return repos
+
+
+def runGit(gitArgs, maxRunning=8):
+    import subprocess
+    import threading
+    repos = findGitRepos(scipionHome)
+    results = {}
+    semaphore = threading.Semaphore(maxRunning)
+
+    def run(repo):
+        with semaphore:
+            try:
+                process = subprocess.Popen(["git"] + gitArgs, cwd=repo,
+                                           stdout=subprocess.PIPE,
+                                           stderr=subprocess.STDOUT)
+                output = process.communicate()[0].decode("utf-8", "replace")
+                results[repo] = (process.returncode, output)
+            except OSError as e:
+                results[repo] = (1, str(e) + "\\n")
+
+    threads = [threading.Thread(target=run, args=(repo,)) for repo in repos]
+    for thread in threads:
+        thread.start()
+    failed = []
+    for repo, thread in zip(repos, threads):
+        thread.join()
+        returnCode, output = results[repo]
+        name = os.path.relpath(repo, scipionHome)
+        sys.stdout.write(" > in " + name + ":\\n" + output + "\\n")
+        sys.stdout.flush()
+        if returnCode != 0:
+            failed.append(name)
+    if failed:
+        sys.stderr.write("git failed in: " + ", ".join(failed) + "\\n")
+        return 1
+    return 0
+
+'''
+
+LAUNCHER_TEMPLATE='''#!/usr/bin/env %(PYTHON_PROGRAM)s
 # Scipion launcher
 import os
 import sys
@@ -12,17 +71,56 @@ scipionHome = dirname(abspath(__file__))
 os.environ["SCIPION_TESTS_CMD"] = basename(__file__) + " tests"
 os.environ["LD_LIBRARY_PATH"] = ":".join([os.environ.get("LD_LIBRARY_PATH", ""), join(scipionHome, "software", "lib")])
 os.environ["PYTHONPATH"] = ":".join([os.environ.get("PYTHONPATH", ""), join(scipionHome, "software", "bindings")])
+''' + GIT_CODE + '''
+if len(sys.argv) > 1 and sys.argv[1] == 'git':
+    exit(runGit(sys.argv[2:]))
+
+# Activate the environment
+cmd = '%(ACTIVATE_ENV_CMD)s && '
+cmd += "python -m scipion %%s" %% " ".join(sys.argv[1:])
+
+# Set SCIPION_HOME
+os.environ["SCIPION_HOME"] = scipionHome
+exit(os.WEXITSTATUS(os.system(cmd)))'''
 
-cmd = ""
+# Launcher with the environment captured at installation time: no shell nor
+# activation at startup, the environment python replaces the launcher process.
+EXEC_LAUNCHER_TEMPLATE='''#!/usr/bin/env %(PYTHON_PROGRAM)s
+# Scipion launcher
+import os
+import sys
+from os.path import dirname, abspath, join, basename
+
+# Environment python and variables set by its activation (%(ACTIVATE_ENV_CMD)s)
+# Regenerate this launcher if the environment changes: installscipion <path> -launcher
+envPython = %(ENV_PYTHON)r
+envChanges = %(ENV_CHANGES)r
+
+# Set SCIPION_HOME to the location of this file
+scipionHome = dirname(abspath(__file__))
+os.environ["SCIPION_TESTS_CMD"] = basename(__file__) + " tests"
+os.environ["LD_LIBRARY_PATH"] = ":".join([os.environ.get("LD_LIBRARY_PATH", ""), join(scipionHome, "software", "lib")])
+os.environ["PYTHONPATH"] = ":".join([os.environ.get("PYTHONPATH", ""), join(scipionHome, "software", "bindings")])
+''' + GIT_CODE + '''
 if len(sys.argv) > 1 and sys.argv[1] == 'git':
-    for repo in ['scipion-app', 'scipion-pyworkflow', 'scipion-em']:
-        cmd += ("(cd "+join(scipionHome, repo)+" ; echo ' > in "+repo+":' ;"
-                " git "+' '.join(sys.argv[2:])+" ; echo) ; ")
-else:
-    # Activate the environment
-    cmd = '%(ACTIVATE_ENV_CMD)s && '
-    cmd += "python -m scipion %%s" %% " ".join(sys.argv[1:])
+    exit(runGit(sys.argv[2:]))
+
+for name, action, value in envChanges:
+    if action == "set":
+        os.environ[name] = value
+    elif action == "prepend":
+        os.environ[name] = value + os.environ.get(name, "")
+    elif action == "paths":
+        # Entries added by the activation first, the current ones but the
+        # removed ones after them
+        added, removed = value
+        entries = [entry for entry in os.environ.get(name, "").split(os.pathsep)
+                   if entry and entry not in added and entry not in removed]
+        os.environ[name] = os.pathsep.join(added + entries)
+    else:
+        os.environ.pop(name, None)
 
 # Set SCIPION_HOME
 os.environ["SCIPION_HOME"] = scipionHome
-exit(os.WEXITSTATUS(os.system(cmd)))'''
\ No newline at end of file
+sys.stdout.flush()
+os.execv(envPython, [envPython, "-m", "scipion"] + sys.argv[1:])'''
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""
+Site installations and user overlays: a site installation (environment,
+software folder and Xmipp) is installed once, read only, and each user gets
+a thin overlay of it: a python environment without packages that sees the
+site ones, a link to its software folder, a config file and a launcher.
+"""
+import json
+import os
+import subprocess
+
+from scipioninstaller import InstallationError, __version__
+
+SITE_VERSION = 1
+# Description of a site installation, in its SCIPION_HOME
+SITE_NAME = ".scipion-site.json"
+# .pth file of the overlay environment adding the site packages
+PTH_NAME = "_scipion_site.pth"
+SOFTWARE_FOLDER = "software"
+
+SITE_DIRS_CODE = ('import json, sysconfig; paths = sysconfig.get_paths(); '
+                  'print(json.dumps(sorted(set([paths["purelib"], paths["platlib"]]))))')
+
+
+def getSiteDirs(python):
+    """ Folders with the packages of the environment of python """
+    try:
+        output = subprocess.check_output([python, "-c", SITE_DIRS_CODE])
+    except (subprocess.CalledProcessError, OSError) as e:
+        raise InstallationError("Package folders of %s could not be found: %s"
+                                % (python, e))
+    if not isinstance(output, str):
+        output = output.decode()
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def writeSiteMetadata(scipionHome, metadata):
+    metadata = dict(metadata, siteVersion=SITE_VERSION, installerVersion=__version__)
+    with open(os.path.join(scipionHome, SITE_NAME), "w") as fh:
+        json.dump(metadata, fh, indent=1)
+    return metadata
+
+
+def readSiteMetadata(siteHome):
+    """ Metadata of the site installation at siteHome """
+    siteFn = os.path.join(siteHome, SITE_NAME)
+    if not os.path.exists(siteFn):
+        raise InstallationError("%s not found: %s is not a site installation "
+                                "(made with -site)." % (siteFn, siteHome))
+    with open(siteFn) as fh:
+        metadata = json.load(fh)
+    if metadata.get("siteVersion") != SITE_VERSION:
+        raise InstallationError("Site installation %s was made by an incompatible "
+                                "installer (%s)." % (siteHome, metadata.get("installerVersion")))
+    return metadata
+
+
+def getPthContent(siteDirs):
+    """ Lines of a .pth file adding siteDirs as site folders: their own .pth
+    files (editable installs, conda packages) are processed too """
+    return "".join("import site; site.addsitedir(%r)\n" % siteDir for siteDir in siteDirs)
+
+
+def createOverlayEnv(envPrefix, sitePython, siteDirs):
+    """ Create at envPrefix a venv of the site python, without pip nor any
+    package: the site ones are found through a .pth file. Packages installed
+    later (python -m pip) go into the overlay. """
+    subprocess.check_call([sitePython, "-m", "venv", "--without-pip", envPrefix])
+    overlayDirs = getSiteDirs(os.path.join(envPrefix, "bin", "python"))
+    with open(os.path.join(overlayDirs[0], PTH_NAME), "w") as fh:
+        fh.write(getPthContent(siteDirs))
+
+
+def linkSoftware(siteHome, overlayHome):
+    """ Link the site software folder (Xmipp, plugin binaries, libraries)
+    into the overlay """
+    link = os.path.join(overlayHome, SOFTWARE_FOLDER)
+    target = os.path.join(siteHome, SOFTWARE_FOLDER)
+    if os.path.islink(link):
+        if os.readlink(link) == target:
+            return
+        os.remove(link)
+    elif os.path.exists(link):
+        raise InstallationError("%s already exists, it should link to %s."
+                                % (link, target))
+    os.symlink(target, link)
+
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+"""
+Plugin lists: plugins given as specs (name, name==version, name@branch) or
+files with one spec per line, installed by the single pip step and then
+built concurrently.
+"""
+import os
+import re
+
+from scipioninstaller import InstallationError
+
+SPEC_REGEX = re.compile(r"^([A-Za-z0-9][A-Za-z0-9._-]*)\s*(?:@\s*(\S+)|([<>=!~].*))?$")
+# Characters of version specifiers the shell would take
+SHELL_CHARS = set("<>!~;* ")
+
+
+def parseSpec(spec):
+    """ dict with the name and the version specifier or git branch of a
+    plugin spec """
+    match = SPEC_REGEX.match(spec.strip())
+    if match is None:
+        raise InstallationError("Wrong plugin %s: use name, name==version or "
+                                "name@branch." % spec)
+    name, branch, version = match.groups()
+    return {"name": name, "branch": branch,
+            "version": version.replace(" ", "") if version else None}
+
+
+def readPlugins(values):
+    """ Plugins of the values of -plugins: specs or files with one spec per
+    line (# for comments). Repeated plugins keep the last spec. """
+    plugins = []
+    for value in values:
+        if os.path.isfile(value):
+            with open(value) as fh:
+                specs = [line.split("#", 1)[0].strip() for line in fh]
+        else:
+            specs = [value]
+        for spec in specs:
+            if spec:
+                plugin = parseSpec(spec)
+                plugins = [p for p in plugins if p["name"] != plugin["name"]]
+                plugins.append(plugin)
+    return plugins
+
+
+def getRequirement(plugin, cloneUrl=None):
+    """ pip requirement of a plugin, quoted for the shell if needed.
+    Branches are installed from cloneUrl. """
+    if plugin["branch"]:
+        requirement = "%s@git+%s@%s" % (plugin["name"], cloneUrl, plugin["branch"])
+    else:
+        requirement = plugin["name"] + (plugin["version"] or "")
+    if SHELL_CHARS.intersection(requirement):
+        requirement = "'%s'" % requirement
+    return requirement
+
+
+def getBuildJobs(builds, jobs):
+    """ Jobs of each of the builds sharing jobs CPUs: an equal share, the
+    remainder going to the first one (e.g. Xmipp, the longest) """
+    share = max(1, jobs // max(1, builds))
+    return [max(share, jobs - share * (builds - 1))] + [share] * (builds - 1)
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+"""
+Resources really usable by the installation: CPUs and memory, taking into
+account affinity, cgroup limits (containers, Slurm allocations) and Slurm
+variables.
+"""
+import multiprocessing
+import os
+
+GB = 1024 ** 3
+# Memory a C++ compile job of Xmipp may need
+MEMORY_PER_JOB = 2 * GB
+CGROUP_ROOT = "/sys/fs/cgroup"
+
+
+def readFirstLine(path):
+    try:
+        with open(path) as fh:
+            return fh.readline().strip()
+    except (IOError, OSError):
+        return None
+
+
+def getCgroupCpus():
+    """ CPUs allowed by the cgroup quota (v2 or v1), None if unlimited """
+    line = readFirstLine(os.path.join(CGROUP_ROOT, "cpu.max"))
+    if line:
+        quota, period = (line.split() + ["100000"])[:2]
+    else:
+        quota = readFirstLine(os.path.join(CGROUP_ROOT, "cpu", "cpu.cfs_quota_us"))
+        period = readFirstLine(os.path.join(CGROUP_ROOT, "cpu", "cpu.cfs_period_us"))
+    try:
+        quota, period = int(quota), int(period)
+    except (TypeError, ValueError):
+        return None  # "max" or no cgroup
+    if quota <= 0 or period <= 0:
+        return None
+    return max(1, -(-quota // period))
+
+
+def getUsableCpus():
+    """ Number of CPUs this process can use """
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = multiprocessing.cpu_count()
+
+    limits = [getCgroupCpus()]
+    for var in ["SLURM_CPUS_PER_TASK", "SLURM_CPUS_ON_NODE"]:
+        try:
+            limits.append(int(os.environ[var]))
+            break
+        except (KeyError, ValueError):
+            pass
+    for limit in limits:
+        if limit:
+            cpus = min(cpus, limit)
+    return max(1, cpus)
+
+
+def getCgroupMemory():
+    """ Memory left below the cgroup limit (v2 or v1), None if unlimited """
+    for limitFn, usageFn in [("memory.max", "memory.current"),
+                             (os.path.join("memory", "memory.limit_in_bytes"),
+                              os.path.join("memory", "memory.usage_in_bytes"))]:
+        limit = readFirstLine(os.path.join(CGROUP_ROOT, limitFn))
+        if limit is None:
+            continue
+        try:
+            limit = int(limit)
+        except ValueError:
+            return None  # "max"
+        # v1 reports a huge number when unlimited
+        if limit >= 2 ** 60:
+            return None
+        usage = readFirstLine(os.path.join(CGROUP_ROOT, usageFn))
+        return limit - int(usage or 0)
+    return None
+
+
+def getAvailableMemory():
+    """ Bytes of memory available for new processes, None if unknown """
+    available = None
+    try:
+        with open("/proc/meminfo") as fh:
+            for line in fh:
+                if line.startswith("MemAvailable:"):
+                    available = int(line.split()[1]) * 1024
+                    break
+    except (IOError, OSError):
+        pass
+
+    if available is None:
+        try:
+            available = os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+        except (AttributeError, ValueError, OSError):
+            pass
+
+    cgroupMemory = getCgroupMemory()
+    if cgroupMemory is not None:
+        available = cgroupMemory if available is None else min(available, cgroupMemory)
+    return available
+
+
+def guessJobs():
+    """ Safe number of parallel build jobs and a text explaining it """
+    cpus = getUsableCpus()
+    memory = getAvailableMemory()
+    jobs = cpus
+    reason = "%s usable CPUs" % cpus
+    if memory is not None:
+        jobs = max(1, min(cpus, memory // MEMORY_PER_JOB))
+        reason += ", %.1f GB of available memory (%s GB per job)" % (
+            float(memory) / GB, MEMORY_PER_JOB // GB)
+    return int(jobs), reason
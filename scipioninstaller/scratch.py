@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+"""
+Scratch folder probing: a short sequential and random read/write test of
+candidate folders to choose the fastest writable one as SCIPION_SCRATCH.
+"""
+import os
+import random
+import tempfile
+import time
+
+MB = 1024 ** 2
+# Data written sequentially and number of random 4 KB operations
+PROBE_SIZE = 64 * MB
+BLOCK_SIZE = MB
+RANDOM_BLOCK = 4096
+RANDOM_OPS = 256
+# Usual local scratch mounts, probed if no candidates are given
+DEFAULT_CANDIDATES = ["/scratch", "/local/scratch", "/localscratch", "/tmp", "/var/tmp"]
+NETWORK_FILESYSTEMS = ("nfs", "nfs4", "cifs", "smb3", "lustre", "gpfs", "beegfs",
+                       "fuse.sshfs", "ceph", "glusterfs")
+# Fastest of all, but they take the memory the processing needs
+MEMORY_FILESYSTEMS = ("tmpfs", "ramfs")
+
+
+def getDefaultCandidates():
+    candidates = []
+    for var in ["TMPDIR", "SLURM_TMPDIR"]:
+        if os.environ.get(var):
+            candidates.append(os.environ[var])
+    return candidates + DEFAULT_CANDIDATES
+
+
+def getFilesystem(folder):
+    """ Type of the filesystem of folder (from /proc/mounts), None if unknown """
+    folder = os.path.realpath(folder)
+    found, fsType = "", None
+    try:
+        with open("/proc/mounts") as fh:
+            for line in fh:
+                fields = line.split()
+                if len(fields) < 3:
+                    continue
+                mountPoint = fields[1].replace("\\040", " ")
+                if ((folder == mountPoint or folder.startswith(mountPoint.rstrip("/") + "/"))
+                        and len(mountPoint) > len(found)):
+                    found, fsType = mountPoint, fields[2]
+    except (IOError, OSError):
+        pass
+    return fsType
+
+
+def dropCache(fd):
+    """ Ask the kernel to forget the cached pages of fd, so reading measures
+    the storage and not the memory """
+    os.fsync(fd)
+    if hasattr(os, "posix_fadvise"):
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+
+
+def probeFolder(folder, size=PROBE_SIZE):
+    """ Measure folder writing and reading a temporary file. Return a dict
+    with the sequential MB/s, random IOPS and total time. """
+    fd, path = tempfile.mkstemp(prefix=".scipion-probe-", dir=folder)
+    try:
+        block = os.urandom(BLOCK_SIZE)
+        blocks = max(1, size // BLOCK_SIZE)
+        start = time.time()
+        for _ in range(blocks):
+            os.write(fd, block)
+        os.fsync(fd)
+        seqWrite = time.time() - start
+        dropCache(fd)
+
+        start = time.time()
+        os.lseek(fd, 0, os.SEEK_SET)
+        while os.read(fd, BLOCK_SIZE):
+            pass
+        seqRead = time.time() - start
+
+        offsets = [random.randrange(blocks * BLOCK_SIZE // RANDOM_BLOCK) * RANDOM_BLOCK
+                   for _ in range(RANDOM_OPS)]
+        data = os.urandom(RANDOM_BLOCK)
+        start = time.time()
+        for offset in offsets:
+            os.lseek(fd, offset, os.SEEK_SET)
+            os.write(fd, data)
+        os.fsync(fd)
+        randomWrite = time.time() - start
+        dropCache(fd)
+
+        random.shuffle(offsets)
+        start = time.time()
+        for offset in offsets:
+            os.lseek(fd, offset, os.SEEK_SET)
+            os.read(fd, RANDOM_BLOCK)
+        randomRead = time.time() - start
+    finally:
+        os.close(fd)
+        os.remove(path)
+
+    mbs = blocks * BLOCK_SIZE / float(MB)
+    tiny = 1e-6
+    return {"seqWrite": mbs / max(seqWrite, tiny), "seqRead": mbs / max(seqRead, tiny),
+            "randomWrite": RANDOM_OPS / max(randomWrite, tiny),
+            "randomRead": RANDOM_OPS / max(randomRead, tiny),
+            "total": seqWrite + seqRead + randomWrite + randomRead}
+
+
+def probeCandidates(candidates, size=PROBE_SIZE):
+    """ Probe the existing candidates not in memory. Return the results
+    (folder, filesystem, measures or None, reason) and the folder with the
+    shortest total time. """
+    results = []
+    best = None
+    seen = set()
+    for folder in candidates:
+        folder = os.path.abspath(os.path.expanduser(folder))
+        if folder in seen or not os.path.isdir(folder):
+            continue
+        seen.add(folder)
+        fsType = getFilesystem(folder)
+        if fsType in MEMORY_FILESYSTEMS:
+            results.append((folder, fsType, None, "in memory"))
+            continue
+        try:
+            stat = os.statvfs(folder)
+            if stat.f_bavail * stat.f_frsize < 2 * size:
+                results.append((folder, fsType, None, "not enough free space"))
+                continue
+            measures = probeFolder(folder, size)
+        except (IOError, OSError) as e:
+            results.append((folder, fsType, None, "not writable: %s" % e.strerror))
+            continue
+        reason = "network filesystem" if fsType in NETWORK_FILESYSTEMS else ""
+        results.append((folder, fsType, measures, reason))
+        if best is None or measures["total"] < best[1]["total"]:
+            best = (folder, measures)
+    return results, best[0] if best else None
+
+
+def getReport(results):
+    """ Lines of a table with the probe results """
+    lines = ["%-30s %-8s %10s %10s %11s %11s  %s" % (
+        "folder", "fs", "write MB/s", "read MB/s", "write IOPS", "read IOPS", "")]
+    for folder, fsType, measures, reason in results:
+        if measures is None:
+            lines.append("%-30s %-8s %s" % (folder, fsType or "?", reason))
+        else:
+            lines.append("%-30s %-8s %10.0f %10.0f %11.0f %11.0f  %s" % (
+                folder, fsType or "?", measures["seqWrite"], measures["seqRead"],
+                measures["randomWrite"], measures["randomRead"], reason))
+    return lines
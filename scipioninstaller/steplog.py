@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""
+Output of the installation steps: streamed to a log file per step, keeping
+in memory only its last lines to explain a failure and, optionally, echoed
+to the terminal prefixed with the step name.
+"""
+import codecs
+import collections
+import os
+import subprocess
+import sys
+import threading
+
+from scipioninstaller.trace import waitProcess
+
+# Lines of a failed step shown in the error
+TAIL_LINES = 30
+# Longest line kept in memory, e.g. progress bars without new lines
+MAX_LINE = 4096
+CHUNK = 64 * 1024
+
+# Steps run in parallel: their echoed lines must not be mixed
+echoLock = threading.Lock()
+
+
+class StepLog(object):
+    """ Log of one step, all the commands it runs (fallbacks included) are
+    appended to logFn """
+
+    def __init__(self, name, logFn, echo=True, tailLines=TAIL_LINES):
+        self.name = name
+        self.logFn = logFn
+        self.echo = echo
+        self.label = "[%s] " % name
+        self.tail = collections.deque(maxlen=tailLines)
+        self.pending = ""
+        self.atLineStart = True
+        open(logFn, "w").close()
+
+    def run(self, cmd):
+        """ Run cmd in a shell streaming its output. Return its return code
+        and the resources it used (see waitProcess). """
+        with open(self.logFn, "ab", 0) as log:
+            log.write(("$ %s\n" % cmd).encode("utf-8"))
+            # stdin is kept: questions (e.g. conda create without -y) are
+            # echoed before their new line
+            process = subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE,
+                                       stderr=subprocess.STDOUT)
+            decoder = codecs.getincrementaldecoder("utf-8")("replace")
+            fd = process.stdout.fileno()
+            while True:
+                data = os.read(fd, CHUNK)
+                if not data:
+                    break
+                log.write(data)
+                self._add(decoder.decode(data))
+            self._add(decoder.decode(b"", True))
+            process.stdout.close()
+            returnCode, usage = waitProcess(process)
+            log.write(("# exit code %s\n" % returnCode).encode("utf-8"))
+        self._endLine()
+        return returnCode, usage
+
+    def _add(self, text):
+        if not text:
+            return
+        if self.echo:
+            self._echo(text)
+        lines = (self.pending + text).split("\n")
+        self.pending = lines.pop()[-MAX_LINE:]
+        for line in lines:
+            # Only the last state of lines rewritten with \r
+            self.tail.append(line.rstrip("\r").split("\r")[-1][-MAX_LINE:])
+
+    def _endLine(self):
+        if self.pending:
+            self.tail.append(self.pending.split("\r")[-1])
+            self.pending = ""
+        if self.echo and not self.atLineStart:
+            self._echo("\n")
+
+    def _echo(self, text):
+        out = []
+        for piece in text.splitlines(True):
+            if self.atLineStart:
+                out.append(self.label)
+            out.append(piece)
+            self.atLineStart = piece.endswith(("\n", "\r"))
+        with echoLock:
+            sys.stdout.write("".join(out))
+            sys.stdout.flush()
+
+    def getFailure(self, returnCode):
+        """ Error message of the step failing with returnCode """
+        lines = ["Step %s failed with exit code %s." % (self.name, returnCode),
+                 "Full output in %s" % self.logFn,
+                 " ",
+                 "Last %s lines:" % len(self.tail)]
+        lines.extend("    %s" % line for line in self.tail)
+        return "\n".join(lines)
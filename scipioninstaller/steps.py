@@ -0,0 +1,237 @@
+# -*- coding: utf-8 -*-
+"""
+Dependency graph of installation steps and a small bounded executor that
+runs independent steps concurrently.
+"""
+import json
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+
+class Step(object):
+    """ A unit of the installation: either a shell command or a python
+    callable, plus the names of the steps it has to wait for. """
+
+    def __init__(self, name, cmd=None, func=None, deps=(), env=True,
+                 fallback=(), inputs=None, skipIf=None, refresh=False,
+                 state=None, cpus=0):
+        """
+        :param name: unique name of the step in the graph
+        :param cmd: shell command (cmdfy chain) to run or a callable
+            returning it, when the step is about to run, from the names of
+            its dependencies that changed something (see getCmd)
+        :param func: python callable to run instead of cmd
+        :param deps: names of the steps that must finish before this one
+        :param env: True if the command needs the scipion environment active
+        :param fallback: commands to run one after the other if cmd fails
+        :param inputs: dict identifying what the step does, to know if it is
+            already done (see Journal). Defaults to the command.
+        :param skipIf: callable telling, when the step is about to run,
+            whether it is not needed because its outputs are already there:
+            it is then recorded as done
+        :param refresh: run it even if it is already done, e.g. pulling
+            repositories when updating
+        :param state: callable returning what the step produced (e.g. the
+            commit of a repository) after running. If it is the one recorded
+            last time, the dependent steps already done are not run again.
+        :param cpus: CPUs used by the step (e.g. build jobs). These steps
+            are limited by the CPU budget of the run instead of the workers.
+        """
+        self.name = name
+        self.cmd = cmd
+        self.func = func
+        self.deps = list(deps)
+        self.env = env
+        self.fallback = list(fallback)
+        self.inputs = inputs
+        self.skipIf = skipIf
+        self.refresh = refresh
+        self.state = state
+        self.cpus = cpus
+
+    def getCmd(self, changedDeps=()):
+        """ Command to run, given the dependencies that changed """
+        if callable(self.cmd):
+            return self.cmd(list(changedDeps))
+        return self.cmd
+
+    def getInputs(self):
+        """ Inputs of the step or None if it has to run always """
+        if self.inputs is not None:
+            return self.inputs
+        if self.cmd is not None and not callable(self.cmd):
+            return {"cmd": self.cmd}
+        return None
+
+    def __repr__(self):
+        return "Step(%s)" % self.name
+
+
+class Journal(object):
+    """ Json file recording the finished steps with their inputs, so an
+    installation run again skips them and resumes at the failed one. """
+
+    def __init__(self, path, force=False):
+        """
+        :param path: json file, usually inside SCIPION_HOME
+        :param force: ignore the previously recorded steps
+        """
+        self.path = path
+        self.lock = threading.Lock()
+        self.entries = {}
+        if not force and os.path.exists(path):
+            with open(path) as fh:
+                self.entries = json.load(fh)
+
+    def isDone(self, name, inputs):
+        entry = self.entries.get(name)
+        return inputs is not None and entry is not None and entry["inputs"] == inputs
+
+    def getState(self, name):
+        """ State recorded for the step (see Step), None if unknown """
+        entry = self.entries.get(name)
+        return None if entry is None else entry.get("state")
+
+    def record(self, name, inputs, elapsed, state=None):
+        with self.lock:
+            self.entries[name] = {"inputs": inputs, "finished": time.time(),
+                                  "elapsed": elapsed}
+            if state is not None:
+                self.entries[name]["state"] = state
+            self._save()
+
+    def forget(self, name):
+        with self.lock:
+            if self.entries.pop(name, None) is not None:
+                self._save()
+
+    def _save(self):
+        tmpPath = self.path + ".tmp"
+        with open(tmpPath, "w") as fh:
+            json.dump(self.entries, fh, indent=2, sort_keys=True)
+        os.rename(tmpPath, self.path)
+
+
+class StepGraph(object):
+    """ Ordered collection of steps forming a directed acyclic graph """
+
+    def __init__(self):
+        self.steps = OrderedDict()
+
+    def add(self, step):
+        if step.name in self.steps:
+            raise ValueError("Duplicated installation step: %s" % step.name)
+        self.steps[step.name] = step
+        return step
+
+    def __contains__(self, name):
+        return name in self.steps
+
+    def __getitem__(self, name):
+        return self.steps[name]
+
+    def __iter__(self):
+        return iter(self.steps.values())
+
+    def __len__(self):
+        return len(self.steps)
+
+    def waves(self):
+        """ Group the steps in waves: each wave only depends on the
+        previous ones, so its steps can run in parallel. """
+        for step in self:
+            for dep in step.deps:
+                if dep not in self.steps:
+                    raise ValueError("Step %s depends on unknown step %s"
+                                     % (step.name, dep))
+        waves = []
+        placed = set()
+        pending = list(self.steps)
+        while pending:
+            wave = [name for name in pending
+                    if all(dep in placed for dep in self.steps[name].deps)]
+            if not wave:
+                raise ValueError("Cyclic dependency among steps: %s"
+                                 % ", ".join(pending))
+            waves.append([self.steps[name] for name in wave])
+            placed.update(wave)
+            pending = [name for name in pending if name not in placed]
+        return waves
+
+    def show(self, out=None):
+        """ Print the graph and its parallel waves """
+        out = out or sys.stdout
+        waves = self.waves()
+        out.write("Installation graph: %s steps in %s waves\n"
+                  % (len(self), len(waves)))
+        for index, wave in enumerate(waves):
+            out.write(" wave %s:\n" % (index + 1))
+            for step in wave:
+                deps = ", ".join(step.deps) if step.deps else "-"
+                out.write("   %-28s <- %s\n" % (step.name, deps))
+        out.flush()
+
+    def run(self, workers, execute, cpus=None):
+        """ Run all the steps calling execute(step), with at most `workers`
+        steps at the same time, not counting the ones using CPUs (see Step):
+        they run while the sum of their CPUs fits in `cpus` (no limit if
+        None), or alone if they need more. A step starts as soon as all its
+        dependencies are done. When a step fails no more steps are started
+        and, once running ones finish, the first error is raised again. """
+        self.waves()  # Validates the graph
+        workers = max(1, int(workers))
+        cond = threading.Condition()
+        pending = list(self.steps)
+        running = set()
+        done = set()
+        errors = []
+        usedCpus = [0]
+        parentName = threading.current_thread().name
+
+        def fits(step):
+            if step.cpus:
+                return (cpus is None or usedCpus[0] == 0
+                        or usedCpus[0] + step.cpus <= cpus)
+            return len([name for name in running if not self.steps[name].cpus]) < workers
+
+        def work(step):
+            try:
+                execute(step)
+            except BaseException:
+                with cond:
+                    errors.append(sys.exc_info())
+            else:
+                with cond:
+                    done.add(step.name)
+            finally:
+                with cond:
+                    running.discard(step.name)
+                    usedCpus[0] -= step.cpus
+                    cond.notify()
+
+        with cond:
+            while True:
+                if not errors:
+                    for name in list(pending):
+                        step = self.steps[name]
+                        if all(dep in done for dep in step.deps) and fits(step):
+                            pending.remove(name)
+                            running.add(name)
+                            usedCpus[0] += step.cpus
+                            # Named after the thread running the graph
+                            # too, see fleet.TargetOutput
+                            thread = threading.Thread(target=work,
+                                                      args=(step,),
+                                                      name="%s/%s" % (parentName, name))
+                            thread.daemon = True
+                            thread.start()
+                if not running:
+                    break
+                # Timeout so KeyboardInterrupt reaches the main thread
+                cond.wait(0.5)
+
+        if errors:
+            raise errors[0][1]
@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+"""
+Per step timing and resources of an installation: wall time, CPU time and
+peak memory and bytes written to disk by the step processes. The trace is
+written in the Chrome trace event format (chrome://tracing, Perfetto).
+"""
+import json
+import os
+import sys
+import threading
+import time
+
+MB = 1024.0 ** 2
+# Unit of ru_oublock in Linux: it counts the bytes sent to the disk
+BLOCK_SIZE = 512
+
+
+def waitProcess(process):
+    """ Wait for a subprocess.Popen process and return its return code and
+    the resources used by it and its descendants (None if unknown) """
+    try:
+        pid, status, rusage = os.wait4(process.pid, 0)
+    except AttributeError:  # No wait4 in this platform
+        return process.wait(), None
+
+    if os.WIFEXITED(status):
+        process.returncode = os.WEXITSTATUS(status)
+    else:
+        process.returncode = -os.WTERMSIG(status)
+    # ru_maxrss is in KB but in bytes on macOS
+    rssUnit = 1 if sys.platform == "darwin" else 1024
+    usage = {"cpuUser": rusage.ru_utime, "cpuSystem": rusage.ru_stime,
+             "maxRss": rusage.ru_maxrss * rssUnit,
+             "written": rusage.ru_oublock * BLOCK_SIZE}
+    return process.returncode, usage
+
+
+def getFolderSize(folder):
+    """ Bytes of the files under folder, without following links """
+    total = 0
+    for root, dirs, files in os.walk(folder):
+        for fileName in files:
+            try:
+                total += os.lstat(os.path.join(root, fileName)).st_size
+            except OSError:
+                pass  # Removed meanwhile
+    return total
+
+
+class Tracer(object):
+    """ Collects the steps of an installation as trace events. Steps run
+    concurrently are shown in different lanes. """
+
+    def __init__(self, scipionHome):
+        self.scipionHome = scipionHome
+        self.origin = time.time()
+        self.lock = threading.Lock()
+        self.lanes = []
+        self.events = []
+        self.steps = []
+
+    def startStep(self, name):
+        with self.lock:
+            if None in self.lanes:
+                lane = self.lanes.index(None)
+                self.lanes[lane] = name
+            else:
+                lane = len(self.lanes)
+                self.lanes.append(name)
+        return {"name": name, "lane": lane, "start": time.time(),
+                "cpuUser": 0.0, "cpuSystem": 0.0, "maxRss": 0, "written": 0}
+
+    def addUsage(self, record, usage):
+        if usage is not None:
+            record["cpuUser"] += usage["cpuUser"]
+            record["cpuSystem"] += usage["cpuSystem"]
+            record["maxRss"] = max(record["maxRss"], usage["maxRss"])
+            record["written"] += usage["written"]
+
+    def endStep(self, record, status="ok"):
+        end = time.time()
+        step = {"name": record["name"], "status": status,
+                "wall": end - record["start"],
+                "cpu": record["cpuUser"] + record["cpuSystem"],
+                "cpuUser": record["cpuUser"], "cpuSystem": record["cpuSystem"],
+                "maxRss": record["maxRss"],
+                "written": record["written"]}
+        with self.lock:
+            self.lanes[record["lane"]] = None
+            self.steps.append(step)
+            self.events.append({"name": record["name"], "cat": "step", "ph": "X",
+                                "pid": 1, "tid": record["lane"] + 1,
+                                "ts": int((record["start"] - self.origin) * 1e6),
+                                "dur": int(step["wall"] * 1e6),
+                                "args": dict((key, value) for key, value in step.items()
+                                             if key != "name")})
+        return step
+
+    def skipStep(self, name, reason):
+        with self.lock:
+            self.steps.append({"name": name, "status": reason, "wall": 0.0,
+                               "cpu": 0.0, "cpuUser": 0.0, "cpuSystem": 0.0,
+                               "maxRss": 0, "written": 0})
+            self.events.append({"name": name, "cat": "step", "ph": "i", "s": "p",
+                                "pid": 1, "tid": 0,
+                                "ts": int((time.time() - self.origin) * 1e6),
+                                "args": {"status": reason}})
+
+    def save(self, path):
+        metadata = [{"name": "process_name", "ph": "M", "pid": 1,
+                     "args": {"name": "scipion installation %s" % self.scipionHome}}]
+        for lane in range(len(self.lanes)):
+            metadata.append({"name": "thread_name", "ph": "M", "pid": 1,
+                             "tid": lane + 1, "args": {"name": "worker %s" % (lane + 1)}})
+        with self.lock:
+            trace = {"traceEvents": metadata + self.events,
+                     "displayTimeUnit": "ms",
+                     "otherData": {"scipionHome": self.scipionHome,
+                                   "start": self.origin,
+                                   "wall": time.time() - self.origin,
+                                   "steps": self.steps}}
+        with open(path, "w") as fh:
+            json.dump(trace, fh, indent=1)
+
+    def getSummary(self):
+        """ Lines of a table with the steps, slowest first """
+        lines = ["%-28s %9s %9s %9s %11s  %s" % ("step", "wall(s)", "cpu(s)",
+                                                 "rss(MB)", "written(MB)", "status")]
+        for step in sorted(self.steps, key=lambda step: -step["wall"]):
+            lines.append("%-28s %9.1f %9.1f %9.1f %11.1f  %s" % (
+                step["name"], step["wall"], step["cpu"], step["maxRss"] / MB,
+                step["written"] / MB, step["status"]))
+        lines.append("%-28s %9.1f" % ("total", time.time() - self.origin))
+        return lines
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""
+Wheelhouse: a folder with all the wheels and sdists needed by an
+installation, plus a manifest with their exact versions and hashes, to
+install without accessing any package index.
+"""
+import hashlib
+import json
+import os
+
+from scipioninstaller import InstallationError
+
+MANIFEST_NAME = "manifest.json"
+LOCK_NAME = "requirements.lock"
+DISTRIBUTION_EXTENSIONS = (".whl", ".tar.gz", ".tar.bz2", ".zip")
+# Needed to build sdists without index access
+BUILD_PACKAGES = ["pip", "setuptools", "wheel"]
+
+
+def getDownloadCmd(wheelhouse, packages):
+    """ Command resolving and downloading packages (names or local folders)
+    with all their dependencies into the wheelhouse """
+    return "pip download --dest %s %s" % (wheelhouse,
+                                          " ".join(BUILD_PACKAGES + list(packages)))
+
+
+def getPipOfflineVars(wheelhouse):
+    """ Environment variables making pip (also when run by scipion to
+    install plugins) and uv install only from the wheelhouse """
+    return [("PIP_NO_INDEX", "1"), ("PIP_FIND_LINKS", wheelhouse),
+            ("UV_NO_INDEX", "1"), ("UV_FIND_LINKS", wheelhouse)]
+
+
+def parseDistribution(fileName):
+    """ Name and version of a wheel or sdist file name """
+    if fileName.endswith(".whl"):
+        name, version = fileName.split("-")[:2]
+    else:
+        for ext in DISTRIBUTION_EXTENSIONS:
+            if fileName.endswith(ext):
+                fileName = fileName[:-len(ext)]
+                break
+        name, version = fileName.rsplit("-", 1)
+    return normalizeName(name), version
+
+
+def normalizeName(name):
+    return name.lower().replace("_", "-").replace(".", "-")
+
+
+def fileHash(path, blockSize=1024 * 1024):
+    sha = hashlib.sha256()
+    with open(path, "rb") as fh:
+        block = fh.read(blockSize)
+        while block:
+            sha.update(block)
+            block = fh.read(blockSize)
+    return sha.hexdigest()
+
+
+def getDistributions(wheelhouse):
+    return sorted(f for f in os.listdir(wheelhouse)
+                  if f.endswith(DISTRIBUTION_EXTENSIONS))
+
+
+def writeManifest(wheelhouse, packages):
+    """ Write the manifest (json) and a pip lock file (name==version with
+    hashes) of the distributions in the wheelhouse """
+
+    distributions = []
+    for fileName in getDistributions(wheelhouse):
+        name, version = parseDistribution(fileName)
+        distributions.append({"file": fileName, "name": name,
+                              "version": version,
+                              "sha256": fileHash(os.path.join(wheelhouse, fileName))})
+
+    manifest = {"packages": list(packages), "distributions": distributions}
+    with open(os.path.join(wheelhouse, MANIFEST_NAME), "w") as fh:
+        json.dump(manifest, fh, indent=2, sort_keys=True)
+
+    hashes = {}
+    for dist in distributions:
+        hashes.setdefault((dist["name"], dist["version"]), []).append(dist["sha256"])
+    with open(os.path.join(wheelhouse, LOCK_NAME), "w") as fh:
+        for (name, version), shas in sorted(hashes.items()):
+            fh.write("%s==%s %s\n" % (name, version,
+                                      " ".join("--hash=sha256:%s" % sha for sha in shas)))
+
+    print("Wheelhouse %s: %s distributions." % (wheelhouse, len(distributions)))
+    return manifest
+
+
+def checkWheelhouse(wheelhouse):
+    """ Verify the wheelhouse files against its manifest """
+
+    manifestFn = os.path.join(wheelhouse, MANIFEST_NAME)
+    if not os.path.exists(manifestFn):
+        raise InstallationError("%s not found. Is %s a wheelhouse built with "
+                                "-buildWheelhouse?" % (manifestFn, wheelhouse))
+    with open(manifestFn) as fh:
+        manifest = json.load(fh)
+
+    errors = []
+    for dist in manifest["distributions"]:
+        path = os.path.join(wheelhouse, dist["file"])
+        if not os.path.exists(path):
+            errors.append("Missing %s" % dist["file"])
+        elif fileHash(path) != dist["sha256"]:
+            errors.append("Hash mismatch for %s" % dist["file"])
+    if errors:
+        raise InstallationError("Wheelhouse %s does not match its manifest:\n%s"
+                                % (wheelhouse, "\n".join(errors)))
+    return manifest
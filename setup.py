@@ -62,7 +62,7 @@ setup(
         'Topic :: Scientific/Engineering'
     ],
     keywords='scipion cryoem imageprocessing scipion-3.0',  # Optional
-    packages=find_packages(),
+    packages=find_packages(exclude=['tests']),
     install_requires=[requirements],
     entry_points={
         'console_scripts': [
@@ -0,0 +1,5 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the installer. They need no network: git repositories, solvers and
+cgroup files are local stand-ins. Run them with python -m unittest discover.
+"""
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+import io
+import json
+import os
+import shutil
+import tarfile
+import tempfile
+import unittest
+
+from scipioninstaller import InstallationError
+from scipioninstaller import bundle
+
+
+class TestReplaceBinary(unittest.TestCase):
+
+    def testPadding(self):
+        data = b"\x7fELF\0/opt/scipion/lib\0RPATH=/opt/scipion/lib:/usr/lib\0end"
+        replaced = bundle.replaceBinary(data, b"/opt/scipion", b"/s")
+        self.assertEqual(len(replaced), len(data))
+        self.assertEqual(replaced.split(b"\0")[:2], [b"\x7fELF", b"/s/lib"])
+        # The rest of each string is kept, padded with nulls up to its end
+        self.assertIn(b"RPATH=/s/lib:/usr/lib" + b"\0" * 10 + b"\0end", replaced)
+
+    def testSameLength(self):
+        data = b"/old/prefix/bin/python\0"
+        self.assertEqual(bundle.replaceBinary(data, b"/old/prefix", b"/new/prefix"),
+                         b"/new/prefix/bin/python\0")
+
+    def testNotTerminated(self):
+        # Only null terminated strings can be padded
+        data = b"/opt/scipion/lib"
+        self.assertEqual(bundle.replaceBinary(data, b"/opt/scipion", b"/s"), data)
+
+
+class TestImportBundle(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.home = os.path.join(self.folder, "original", "scipion")
+        os.makedirs(os.path.join(self.home, "bin"))
+        self.bundleFn = os.path.join(self.folder, "bundle.tar.gz")
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def writeFile(self, name, content):
+        with open(os.path.join(self.home, name), "wb") as fh:
+            fh.write(content)
+
+    def testRelocation(self):
+        prefix = self.home.encode()
+        self.writeFile(os.path.join("bin", "tool"), b"#!" + prefix + b"/bin/python\n")
+        self.writeFile("lib.so", b"\x7f\0" + prefix + b"/lib\0")
+        os.symlink(os.path.join(self.home, "bin", "tool"), os.path.join(self.home, "tool"))
+        bundle.exportBundle(self.home, self.bundleFn, {"devel": False})
+
+        newHome = os.path.join(self.folder, "new")
+        bundle.importBundle(self.bundleFn, newHome)
+        with open(os.path.join(newHome, "bin", "tool"), "rb") as fh:
+            self.assertEqual(fh.read(), b"#!" + newHome.encode() + b"/bin/python\n")
+        with open(os.path.join(newHome, "lib.so"), "rb") as fh:
+            self.assertEqual(fh.read().rstrip(b"\0"), b"\x7f\0" + newHome.encode() + b"/lib")
+        # Links into the installation are relative
+        self.assertEqual(os.readlink(os.path.join(newHome, "tool")),
+                         os.path.join("bin", "tool"))
+
+    def writeBundle(self, members):
+        """ Bundle of this machine with members: (name, type, linkname) """
+        metadata = bundle.exportBundle(self.home, self.bundleFn, {})
+        with tarfile.open(self.bundleFn, "w:gz") as tar:
+            data = json.dumps(dict(metadata, files=[])).encode()
+            info = tarfile.TarInfo(bundle.METADATA_NAME)
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+            for name, memberType, linkname in members:
+                info = tarfile.TarInfo(name)
+                info.type = memberType
+                if memberType == tarfile.REGTYPE:
+                    info.size = 1
+                    tar.addfile(info, io.BytesIO(b"x"))
+                else:
+                    info.linkname = linkname
+                    tar.addfile(info)
+
+    def assertRefused(self, members):
+        self.writeBundle(members)
+        target = tempfile.mkdtemp(dir=self.folder)
+        self.assertRaises(InstallationError, bundle.importBundle, self.bundleFn,
+                          os.path.join(target, "scipion"))
+
+    def testRefusedMembers(self):
+        outside = os.path.join(self.folder, "outside")
+        self.assertRefused([("home/../../outside", tarfile.REGTYPE, None)])
+        self.assertRefused([("home/link", tarfile.SYMTYPE, self.folder),
+                            ("home/link/outside", tarfile.REGTYPE, None)])
+        self.assertRefused([("home/link", tarfile.SYMTYPE, outside),
+                            ("home/link", tarfile.REGTYPE, None)])
+        self.assertRefused([("home/hard", tarfile.LNKTYPE, "home/../../outside")])
+        self.assertFalse(os.path.lexists(outside))
+        self.assertFalse(os.path.lexists(os.path.join(self.folder, "link")))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+
+try:
+    from unittest import mock
+except ImportError:  # python 2
+    import mock
+
+from scipioninstaller.installer import (SCIPION_GIT_SERVER, SCIPION_GIT_MIRROR, JOURNAL_NAME,
+                                        getParser, getRepoSteps, getMirrorPath,
+                                        runInstallationGraph)
+from scipioninstaller.steps import StepGraph, Journal
+
+ORGANIZATION = "scipion-em"
+REPO = "scipion-em-dummy"
+BRANCH = "devel"
+
+
+def git(gitArgs, cwd):
+    output = subprocess.check_output(["git"] + gitArgs, cwd=cwd)
+    return output.decode().strip()
+
+
+class TestClones(unittest.TestCase):
+    """ Clone steps of devel installations against a local bare repository
+    served through SCIPION_GIT_SERVER """
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        server = os.path.join(self.folder, "server")
+        self.bare = os.path.join(server, ORGANIZATION, REPO + ".git")
+        self.work = os.path.join(self.folder, "work")
+        patch = mock.patch.dict(os.environ, {SCIPION_GIT_SERVER: "file://" + server,
+                                             "GIT_AUTHOR_NAME": "test",
+                                             "GIT_AUTHOR_EMAIL": "test@localhost",
+                                             "GIT_COMMITTER_NAME": "test",
+                                             "GIT_COMMITTER_EMAIL": "test@localhost"})
+        patch.start()
+        self.addCleanup(patch.stop)
+        os.environ.pop(SCIPION_GIT_MIRROR, None)
+
+        os.makedirs(self.bare)
+        git(["init", "--quiet", "--bare"], self.bare)
+        os.makedirs(self.work)
+        git(["init", "--quiet"], self.work)
+        git(["checkout", "--quiet", "-b", BRANCH], self.work)
+        for index in range(3):
+            self.commit(index)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def commit(self, index):
+        """ Push a new commit to the server, return it """
+        with open(os.path.join(self.work, "version.txt"), "w") as fh:
+            fh.write("%s\n" % index)
+        git(["add", "version.txt"], self.work)
+        git(["commit", "--quiet", "-m", "commit %s" % index], self.work)
+        git(["push", "--quiet", self.bare, BRANCH], self.work)
+        return git(["rev-parse", "HEAD"], self.work)
+
+    def install(self, home, *options):
+        """ Run the clone steps of the repository into home, return its path """
+        if not os.path.exists(home):
+            os.makedirs(home)
+        args = getParser().parse_args([home, "-dev"] + list(options))
+        graph = StepGraph()
+        for step in getRepoSteps(home, REPO, True, args, organization=ORGANIZATION,
+                                 branch=BRANCH):
+            graph.add(step)
+        runInstallationGraph(graph, home, "", 2, False,
+                             journal=Journal(os.path.join(home, JOURNAL_NAME)))
+        return os.path.join(home, REPO)
+
+    def getHistory(self, repo):
+        """ Whether repo is shallow and its number of commits """
+        return (git(["rev-parse", "--is-shallow-repository"], repo) == "true",
+                int(git(["rev-list", "--count", "HEAD"], repo)))
+
+    def testUnshallowRoundTrip(self):
+        home = os.path.join(self.folder, "home")
+        repo = self.install(home, "-cloneDepth", "1", "-singleBranch")
+        self.assertEqual(self.getHistory(repo), (True, 1))
+
+        self.commit(3)
+        self.install(home, "-unshallow")
+        self.assertEqual(self.getHistory(repo), (False, 4))
+
+        # A shallow pull keeps the full history already there
+        head = self.commit(4)
+        self.install(home, "-cloneDepth", "1")
+        self.assertEqual(self.getHistory(repo), (False, 5))
+        self.assertEqual(git(["rev-parse", "HEAD"], repo), head)
+
+    def testShallowPull(self):
+        home = os.path.join(self.folder, "home")
+        repo = self.install(home, "-cloneDepth", "1")
+        head = self.commit(3)
+        # Done as before: only pulled with -update
+        self.install(home, "-cloneDepth", "1")
+        self.assertNotEqual(git(["rev-parse", "HEAD"], repo), head)
+        self.install(home, "-cloneDepth", "1", "-update")
+        self.assertEqual(git(["rev-parse", "HEAD"], repo), head)
+        self.assertTrue(self.getHistory(repo)[0])
+
+    def testMirror(self):
+        mirrorDir = os.path.join(self.folder, "mirrors")
+        mirror = getMirrorPath(mirrorDir, ORGANIZATION, REPO)
+        repo = self.install(os.path.join(self.folder, "home1"), "-gitMirror", mirrorDir)
+        self.assertEqual(git(["rev-parse", BRANCH], mirror),
+                         git(["rev-parse", "HEAD"], self.work))
+        # Dissociated: the clone does not need the mirror
+        self.assertFalse(os.path.exists(os.path.join(repo, ".git", "objects", "info",
+                                                     "alternates")))
+
+        # The next installation updates the mirror first
+        head = self.commit(3)
+        repo = self.install(os.path.join(self.folder, "home2"), "-gitMirror", mirrorDir)
+        self.assertEqual(git(["rev-parse", BRANCH], mirror), head)
+        self.assertEqual(git(["rev-parse", "HEAD"], repo), head)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import tempfile
+import unittest
+
+try:
+    from unittest import mock
+except ImportError:  # python 2
+    import mock
+
+from scipioninstaller import InstallationError
+from scipioninstaller import installer
+from scipioninstaller.installer import (CONDA, MAMBA, MICROMAMBA, CONDA_ACTIVATION_CMD,
+                                        getCondaCmd, guessCondaSolver, runCmd,
+                                        captureEnvironment, createConfigFile, getArgs)
+
+# Fake solvers: conda hook defining a conda function, all of them logging
+# how they are called
+CONDA_SCRIPT = """#!/bin/sh
+if [ "$1" = shell.bash ]; then
+    echo 'conda() { echo "conda $*" >> "%(log)s"; }'
+else
+    echo "conda $*" >> "%(log)s"
+fi
+"""
+MICROMAMBA_SCRIPT = """#!/bin/sh
+if [ "$1" = shell ]; then
+    echo 'micromamba() { echo "micromamba $*" >> "%(log)s"; }'
+else
+    echo "micromamba $*" >> "%(log)s"
+fi
+"""
+MAMBA_SCRIPT = """#!/bin/sh
+echo "mamba $*" >> "%(log)s"
+"""
+
+
+class TestSolvers(unittest.TestCase):
+    """ Environment commands of each conda compatible solver, run with fake
+    ones on the PATH """
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.binDir = os.path.join(self.folder, "bin")
+        os.mkdir(self.binDir)
+        self.log = os.path.join(self.folder, "calls.log")
+        # Only the fake solvers: the commands use shell builtins
+        patch = mock.patch.dict(os.environ, {"PATH": self.binDir, "SHELL": "/bin/bash"})
+        patch.start()
+        self.addCleanup(patch.stop)
+        os.environ.pop(CONDA_ACTIVATION_CMD, None)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def addSolver(self, name, script):
+        path = os.path.join(self.binDir, name)
+        with open(path, "w") as fh:
+            fh.write(script % {"log": self.log})
+        os.chmod(path, 0o755)
+        # Cached by PATH, that does not change
+        installer.foundPrograms.clear()
+        return path
+
+    def runSolver(self, solver, offline=False):
+        """ Run the environment command, return the solver calls """
+        runCmd("cd %s && " % self.folder +
+               getCondaCmd("scipion3", True, True, offline, solver), False)
+        with open(self.log) as fh:
+            return fh.read().splitlines()
+
+    def testGuess(self):
+        self.assertIsNone(guessCondaSolver())
+        self.addSolver(CONDA, CONDA_SCRIPT)
+        self.assertEqual(guessCondaSolver(), CONDA)
+        self.addSolver(MICROMAMBA, MICROMAMBA_SCRIPT)
+        self.assertEqual(guessCondaSolver(), MICROMAMBA)
+        self.addSolver(MAMBA, MAMBA_SCRIPT)
+        self.assertEqual(guessCondaSolver(), MAMBA)
+
+    def testConda(self):
+        self.addSolver(CONDA, CONDA_SCRIPT)
+        self.assertEqual(self.runSolver(CONDA, offline=True),
+                         ["conda create -y --offline -n scipion3 python=3.8",
+                          "conda activate scipion3"])
+
+    def testMamba(self):
+        # Environments created by mamba are activated by conda
+        self.addSolver(CONDA, CONDA_SCRIPT)
+        self.addSolver(MAMBA, MAMBA_SCRIPT)
+        self.assertEqual(self.runSolver(MAMBA),
+                         ["mamba create -y -n scipion3 python=3.8",
+                          "conda activate scipion3"])
+
+    def testMicromamba(self):
+        micromamba = self.addSolver(MICROMAMBA, MICROMAMBA_SCRIPT)
+        self.assertEqual(self.runSolver(MICROMAMBA),
+                         ["micromamba create -y -n scipion3 python=3.8 -c conda-forge",
+                          "micromamba activate scipion3"])
+        # In the config file too, even with a conda activation command
+        os.environ[CONDA_ACTIVATION_CMD] = "eval conda"
+        createConfigFile(self.folder, None, False, MICROMAMBA)
+        with open(os.path.join(self.folder, "config", "scipion.conf")) as fh:
+            self.assertIn('%s = eval "$(%s shell hook -s bash)"'
+                          % (CONDA_ACTIVATION_CMD, micromamba), fh.read())
+
+
+class TestCaptureEnvironment(unittest.TestCase):
+
+    def testChanges(self):
+        environ = {"PATH": "/opt/old/bin" + os.pathsep + os.environ["PATH"],
+                   "TEST_PREPEND": "tail", "TEST_GONE": "1", "TEST_KEEP": "1"}
+        activation = ('export PATH="/opt/env/bin:$(echo "$PATH" | sed "s#/opt/old/bin:##")" && '
+                      'export LD_LIBRARY_PATH=/opt/env/lib && '
+                      'export TEST_PREPEND="head:$TEST_PREPEND" && '
+                      'export TEST_SET=value && unset TEST_GONE')
+        with mock.patch.dict(os.environ, environ):
+            os.environ.pop("LD_LIBRARY_PATH", None)
+            python, changes = captureEnvironment(activation)
+        changes = dict((name, (action, value)) for name, action, value in changes)
+        self.assertTrue(os.path.exists(python))
+        self.assertEqual(changes["PATH"], ("paths", [["/opt/env/bin"], ["/opt/old/bin"]]))
+        self.assertEqual(changes["LD_LIBRARY_PATH"], ("paths", [["/opt/env/lib"], []]))
+        self.assertEqual(changes["TEST_PREPEND"], ("prepend", "head:"))
+        self.assertEqual(changes["TEST_SET"], ("set", "value"))
+        self.assertEqual(changes["TEST_GONE"], ("unset", None))
+        self.assertNotIn("TEST_KEEP", changes)
+
+
+class TestGetArgs(unittest.TestCase):
+
+    def testParsed(self):
+        args = getArgs("/opt/scipion", plugins="scipion-em-relion", j="4",
+                       noXmipp=True, dev=False, scratchCandidate=["/scratch", "/tmp"])
+        self.assertEqual(args.path, "/opt/scipion")
+        self.assertEqual(args.plugins, ["scipion-em-relion"])
+        self.assertEqual(args.j, 4)
+        self.assertTrue(args.noXmipp)
+        self.assertFalse(args.dev)
+        self.assertEqual(args.scratchCandidate, ["/scratch", "/tmp"])
+
+    def testWrongOptions(self):
+        for options in [{"j": "four"}, {"noXmipp": "yes"}, {"unknown": 1},
+                        {"j": [1, 2]}, {"manifest": "fleet.json"}]:
+            self.assertRaises(InstallationError, getArgs, "/opt/scipion", **options)
+
+
+if __name__ == '__main__':
+    unittest.main()
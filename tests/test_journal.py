@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import tempfile
+import unittest
+
+from scipioninstaller import InstallationError
+from scipioninstaller.installer import runInstallationGraph, cmdfy
+from scipioninstaller.steps import Step, StepGraph, Journal
+
+
+class TestJournal(unittest.TestCase):
+    """ Steps run again or skipped by runInstallationGraph with a journal """
+
+    def setUp(self):
+        self.home = tempfile.mkdtemp()
+        self.journalFn = os.path.join(self.home, "journal.json")
+
+    def tearDown(self):
+        shutil.rmtree(self.home)
+
+    def getStep(self, name, deps=(), fail=False, **kwargs):
+        """ Step appending its name to runs.txt """
+        cmd = cmdfy("echo %s >> runs.txt" % name)
+        if fail:
+            cmd += cmdfy("test -e fixed")
+        return Step(name, cmd, deps=deps, env=False, **kwargs)
+
+    def runSteps(self, steps, force=False):
+        """ Run the steps, return the ones that ran """
+        graph = StepGraph()
+        for step in steps:
+            graph.add(step)
+        runsFn = os.path.join(self.home, "runs.txt")
+        if os.path.exists(runsFn):
+            os.remove(runsFn)
+        runInstallationGraph(graph, self.home, "", 2, False,
+                             journal=Journal(self.journalFn, force))
+        if not os.path.exists(runsFn):
+            return []
+        with open(runsFn) as fh:
+            return sorted(fh.read().split())
+
+    def testSkipDone(self):
+        def getSteps():
+            return [self.getStep("a"), self.getStep("b", ["a"])]
+        self.assertEqual(self.runSteps(getSteps()), ["a", "b"])
+        self.assertEqual(self.runSteps(getSteps()), [])
+        # -force
+        self.assertEqual(self.runSteps(getSteps(), force=True), ["a", "b"])
+
+    def testChangedInputs(self):
+        self.runSteps([self.getStep("a"), self.getStep("b")])
+        self.assertEqual(self.runSteps([self.getStep("a", inputs={"option": 2}),
+                                        self.getStep("b")]), ["a"])
+
+    def testResume(self):
+        steps = [self.getStep("a"), self.getStep("b", ["a"], fail=True),
+                 self.getStep("c", ["b"])]
+        self.assertRaises(InstallationError, self.runSteps, steps)
+        open(os.path.join(self.home, "fixed"), "w").close()
+        self.assertEqual(self.runSteps(steps), ["b", "c"])
+
+    def testRefresh(self):
+        self.runSteps([self.getStep("a"), self.getStep("b", ["a"])])
+        self.assertEqual(self.runSteps([self.getStep("a", refresh=True),
+                                        self.getStep("b", ["a"])]), ["a", "b"])
+
+    def testUnchangedState(self):
+        # A refreshed step producing the same state does not rerun the next ones
+        steps = [self.getStep("a", refresh=True, state=lambda: "commit"),
+                 self.getStep("b", ["a"])]
+        self.runSteps(steps)
+        self.assertEqual(self.runSteps(steps), ["a"])
+        steps[0].state = lambda: "new commit"
+        self.assertEqual(self.runSteps(steps), ["a", "b"])
+
+    def testSkipIf(self):
+        steps = [self.getStep("a", skipIf=lambda: True), self.getStep("b", ["a"])]
+        self.assertEqual(self.runSteps(steps), ["b"])
+        self.assertTrue(Journal(self.journalFn).isDone("a", steps[0].getInputs()))
+        self.assertEqual(self.runSteps(steps), [])
+        # Its outputs were put there (e.g. restored from a cache): the next
+        # steps run again
+        steps[0].refresh = True
+        self.assertEqual(self.runSteps(steps), ["b"])
+
+
+if __name__ == '__main__':
+    unittest.main()
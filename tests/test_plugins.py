@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import tempfile
+import unittest
+
+from scipioninstaller import InstallationError
+from scipioninstaller.plugins import parseSpec, readPlugins, getRequirement, getBuildJobs
+
+
+class TestSpecs(unittest.TestCase):
+
+    def testParseSpec(self):
+        self.assertEqual(parseSpec("scipion-em-relion"),
+                         {"name": "scipion-em-relion", "branch": None, "version": None})
+        self.assertEqual(parseSpec(" scipion-em-relion >= 4.0 , < 5 "),
+                         {"name": "scipion-em-relion", "branch": None, "version": ">=4.0,<5"})
+        self.assertEqual(parseSpec("scipion-em-relion@devel"),
+                         {"name": "scipion-em-relion", "branch": "devel", "version": None})
+        for spec in ["", "-plugin", "plugin@", "plugin version"]:
+            self.assertRaises(InstallationError, parseSpec, spec)
+
+    def testReadPlugins(self):
+        folder = tempfile.mkdtemp()
+        try:
+            listFn = os.path.join(folder, "plugins.txt")
+            with open(listFn, "w") as fh:
+                fh.write("# Plugins of the facility\n"
+                         "scipion-em-relion==4.0.1\n"
+                         "\n"
+                         "scipion-em-eman2  # tomography too\n")
+            plugins = readPlugins(["scipion-em-eman2@devel", listFn, "scipion-em-relion"])
+        finally:
+            shutil.rmtree(folder)
+        # Repeated plugins keep the last spec
+        self.assertEqual([(p["name"], p["branch"], p["version"]) for p in plugins],
+                         [("scipion-em-eman2", None, None),
+                          ("scipion-em-relion", None, None)])
+
+    def testRequirement(self):
+        self.assertEqual(getRequirement(parseSpec("scipion-em-relion==4.0")),
+                         "scipion-em-relion==4.0")
+        self.assertEqual(getRequirement(parseSpec("scipion-em-relion>=4")),
+                         "'scipion-em-relion>=4'")
+        self.assertEqual(getRequirement(parseSpec("scipion-em-relion@devel"),
+                                        "https://github.com/scipion-em/scipion-em-relion.git"),
+                         "scipion-em-relion@git+https://github.com/scipion-em/"
+                         "scipion-em-relion.git@devel")
+
+
+class TestBuildJobs(unittest.TestCase):
+
+    def testShares(self):
+        self.assertEqual(getBuildJobs(1, 8), [8])
+        self.assertEqual(getBuildJobs(3, 8), [4, 2, 2])
+        self.assertEqual(getBuildJobs(4, 8), [2, 2, 2, 2])
+
+    def testMoreBuildsThanJobs(self):
+        # Each build has at least one job: the CPU budget serializes them
+        self.assertEqual(getBuildJobs(3, 2), [1, 1, 1])
+
+
+if __name__ == '__main__':
+    unittest.main()
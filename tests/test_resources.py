@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import tempfile
+import unittest
+
+try:
+    from unittest import mock
+except ImportError:  # python 2
+    import mock
+
+from scipioninstaller import resources
+
+GB = resources.GB
+
+
+class TestResources(unittest.TestCase):
+    """ CPUs and memory of a machine with 8 CPUs, 64 GB available and the
+    cgroup files written by each test """
+
+    def setUp(self):
+        self.cgroup = tempfile.mkdtemp()
+        patches = [mock.patch.object(resources, "CGROUP_ROOT", self.cgroup),
+                   mock.patch.dict(os.environ),
+                   mock.patch.object(resources.multiprocessing, "cpu_count",
+                                     return_value=8)]
+        if hasattr(os, "sched_getaffinity"):
+            patches.append(mock.patch.object(os, "sched_getaffinity",
+                                             return_value=set(range(8))))
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        for var in ["SLURM_CPUS_PER_TASK", "SLURM_CPUS_ON_NODE"]:
+            os.environ.pop(var, None)
+
+    def tearDown(self):
+        shutil.rmtree(self.cgroup)
+
+    def writeCgroup(self, name, content):
+        path = os.path.join(self.cgroup, name)
+        if not os.path.exists(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, "w") as fh:
+            fh.write(content + "\n")
+
+    def guessJobs(self, memory=64 * GB):
+        # /proc/meminfo is the real one: only the cgroup limits are fixtures
+        with mock.patch.object(resources, "getAvailableMemory",
+                               return_value=memory):
+            return resources.guessJobs()[0]
+
+    def testNoLimits(self):
+        self.assertIsNone(resources.getCgroupCpus())
+        self.assertIsNone(resources.getCgroupMemory())
+        self.assertEqual(self.guessJobs(), 8)
+
+    def testCgroupV2(self):
+        self.writeCgroup("cpu.max", "250000 100000")
+        self.assertEqual(resources.getCgroupCpus(), 3)
+        self.assertEqual(self.guessJobs(), 3)
+        self.writeCgroup("cpu.max", "max 100000")
+        self.assertIsNone(resources.getCgroupCpus())
+
+        self.writeCgroup("memory.max", str(10 * GB))
+        self.writeCgroup("memory.current", str(4 * GB))
+        self.assertEqual(resources.getCgroupMemory(), 6 * GB)
+        self.writeCgroup("memory.max", "max")
+        self.assertIsNone(resources.getCgroupMemory())
+
+    def testCgroupV1(self):
+        self.writeCgroup(os.path.join("cpu", "cpu.cfs_quota_us"), "200000")
+        self.writeCgroup(os.path.join("cpu", "cpu.cfs_period_us"), "100000")
+        self.assertEqual(resources.getCgroupCpus(), 2)
+        self.writeCgroup(os.path.join("cpu", "cpu.cfs_quota_us"), "-1")
+        self.assertIsNone(resources.getCgroupCpus())
+
+        self.writeCgroup(os.path.join("memory", "memory.limit_in_bytes"), str(2 ** 63 - 4096))
+        self.assertIsNone(resources.getCgroupMemory())
+        self.writeCgroup(os.path.join("memory", "memory.limit_in_bytes"), str(8 * GB))
+        self.writeCgroup(os.path.join("memory", "memory.usage_in_bytes"), str(GB))
+        self.assertEqual(resources.getCgroupMemory(), 7 * GB)
+
+    def testSlurm(self):
+        os.environ["SLURM_CPUS_ON_NODE"] = "6"
+        self.assertEqual(self.guessJobs(), 6)
+        # Per task first
+        os.environ["SLURM_CPUS_PER_TASK"] = "4"
+        self.assertEqual(self.guessJobs(), 4)
+        # The lowest limit wins
+        self.writeCgroup("cpu.max", "200000 100000")
+        self.assertEqual(self.guessJobs(), 2)
+
+    def testMemory(self):
+        self.assertEqual(self.guessJobs(memory=5 * GB), 2)
+        self.assertEqual(self.guessJobs(memory=GB), 1)
+        self.assertEqual(self.guessJobs(memory=None), 8)
+
+    def testCgroupMemoryLimitsAvailable(self):
+        self.writeCgroup("memory.max", str(6 * GB))
+        self.writeCgroup("memory.current", "0")
+        self.assertLessEqual(resources.getAvailableMemory(), 6 * GB)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+import threading
+import time
+import unittest
+
+from scipioninstaller.steps import Step, StepGraph
+
+
+def getGraph(*steps):
+    graph = StepGraph()
+    for step in steps:
+        graph.add(step)
+    return graph
+
+
+class Recorder(object):
+    """ execute function of StepGraph.run recording the running steps """
+
+    def __init__(self, delay=0.05, fail=(), delays=None):
+        self.delay = delay
+        self.delays = delays or {}
+        self.fail = fail
+        self.lock = threading.Lock()
+        self.running = set()
+        self.started = []
+        self.finished = []
+        self.maxRunning = 0
+        self.maxCpus = 0
+        self.steps = {}
+
+    def __call__(self, step):
+        with self.lock:
+            self.steps[step.name] = step
+            self.running.add(step.name)
+            self.started.append(step.name)
+            self.maxRunning = max(self.maxRunning, len(self.running))
+            self.maxCpus = max(self.maxCpus, sum(self.steps[name].cpus
+                                                 for name in self.running))
+        time.sleep(self.delays.get(step.name, self.delay))
+        with self.lock:
+            self.running.discard(step.name)
+            self.finished.append(step.name)
+        if step.name in self.fail:
+            raise RuntimeError("%s failed" % step.name)
+
+
+class TestWaves(unittest.TestCase):
+
+    def testWaves(self):
+        graph = getGraph(Step("env"), Step("clone-a"), Step("clone-b"),
+                         Step("pip", deps=["env", "clone-a", "clone-b"]),
+                         Step("build", deps=["pip"]), Step("launcher", deps=["env"]))
+        waves = [[step.name for step in wave] for wave in graph.waves()]
+        self.assertEqual(waves, [["env", "clone-a", "clone-b"],
+                                 ["pip", "launcher"], ["build"]])
+
+    def testWrongGraphs(self):
+        graph = getGraph(Step("a"))
+        self.assertRaises(ValueError, graph.add, Step("a"))
+        self.assertRaises(ValueError, getGraph(Step("a", deps=["b"])).waves)
+        self.assertRaises(ValueError, getGraph(Step("a", deps=["b"]),
+                                               Step("b", deps=["a"])).waves)
+
+
+class TestRun(unittest.TestCase):
+
+    def testDependenciesFirst(self):
+        graph = getGraph(Step("a"), Step("b", deps=["a"]), Step("c", deps=["a"]),
+                         Step("d", deps=["b", "c"]))
+        recorder = Recorder(delay=0.01)
+        graph.run(4, recorder)
+        for step in graph:
+            for dep in step.deps:
+                self.assertLess(recorder.finished.index(dep),
+                                recorder.started.index(step.name))
+
+    def testWorkers(self):
+        graph = getGraph(*[Step("step-%s" % i) for i in range(6)])
+        recorder = Recorder()
+        graph.run(2, recorder)
+        self.assertEqual(recorder.maxRunning, 2)
+        self.assertEqual(len(recorder.finished), 6)
+
+    def testCpuBudget(self):
+        # CPU steps do not count as workers, but share the budget
+        graph = getGraph(Step("build-a", cpus=2), Step("build-b", cpus=2),
+                         Step("build-c", cpus=1), Step("clone"))
+        recorder = Recorder()
+        graph.run(1, recorder, cpus=3)
+        self.assertEqual(recorder.maxCpus, 3)
+        self.assertEqual(len(recorder.finished), 4)
+
+    def testStepOverBudgetRunsAlone(self):
+        graph = getGraph(Step("small", cpus=1), Step("big", cpus=8))
+        recorder = Recorder()
+        graph.run(4, recorder, cpus=4)
+        self.assertEqual(recorder.maxCpus, 8)
+        self.assertEqual(recorder.maxRunning, 1)
+
+    def testFailure(self):
+        # The failed step stops new ones, running ones finish
+        graph = getGraph(Step("fails"), Step("slow"), Step("after", deps=["fails"]),
+                         Step("later", deps=["slow"]))
+        recorder = Recorder(fail=["fails"], delays={"slow": 0.3})
+        with self.assertRaises(RuntimeError) as context:
+            graph.run(2, recorder)
+        self.assertEqual(str(context.exception), "fails failed")
+        self.assertIn("slow", recorder.finished)
+        self.assertNotIn("after", recorder.started)
+        self.assertNotIn("later", recorder.started)
+
+    def testThreadNames(self):
+        names = []
+        graph = getGraph(Step("a"))
+        graph.run(1, lambda step: names.append(threading.current_thread().name))
+        self.assertEqual(names, ["%s/a" % threading.current_thread().name])
+
+
+if __name__ == '__main__':
+    unittest.main()